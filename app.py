@@ -1,5 +1,5 @@
-from flask import Flask, request, render_template, redirect, url_for
-from datetime import datetime, timedelta, date
+from flask import Flask, request, render_template, redirect, url_for, send_from_directory
+from datetime import datetime, timedelta
 
 from apscheduler.schedulers.background import BackgroundScheduler
 from googleapiclient.discovery import build
@@ -7,12 +7,31 @@ from googleapiclient.errors import HttpError
 
 
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func
+from sqlalchemy import func, update, insert, select, literal, or_, and_, inspect, text, union_all, bindparam, case
+from sqlalchemy import table as sql_table, column as sql_column
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.utils import import_string
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
+from flask_bcrypt import Bcrypt
+from filelock import FileLock
 
 import pytz
+import atexit
 import random
+import json
+import mimetypes
+import hashlib
+import sqlite3
+import os
+import threading
+import time
+import queue
+from concurrent.futures import ThreadPoolExecutor, Future
+from contextlib import contextmanager
 
 
 YOUTUBE_API_KEYS = [
@@ -26,27 +45,653 @@ YOUTUBE_API_KEYS = [
 
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
+# the database comes from DATABASE_URL so a deploy can point every host at the same postgres server,
+# without it the app uses the sqlite file in the instance folder like before
+database_url = os.environ.get('DATABASE_URL', 'sqlite:///database.db')
+# some hosts still hand out the old postgres:// name that sqlalchemy no longer accepts
+if database_url.startswith('postgres://'):
+    database_url = 'postgresql://' + database_url[len('postgres://'):]
+app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+# 'sqlite' or 'postgresql', for the few settings that only one of them understands
+database_backend = make_url(database_url).get_backend_name()
+# an in-memory sqlite database (sqlite:// or sqlite:///:memory:) only lives as long as its one connection, so
+# its pool never opens more than that one and doesn't take a size
+database_name = make_url(database_url).database or ''
+database_in_memory = database_backend == 'sqlite' and (database_name in ('', ':memory:') or 'mode=memory' in database_url)
+# how many seconds before a connection is replaced (servers close idle ones), pre_ping checks a connection still
+# works before it is handed out
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_recycle': int(os.environ.get('DATABASE_POOL_RECYCLE', 1800)),
+    'pool_pre_ping': True,
+}
+# connections kept open per worker and how many more it can open when busy
+if not database_in_memory:
+    app.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_size'] = int(os.environ.get('DATABASE_POOL_SIZE', 5))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS']['max_overflow'] = int(os.environ.get('DATABASE_MAX_OVERFLOW', 10))
 app.config['SECRET_KEY'] = 'thisisasecretkey'
+# how many users are shown on each page of the full rank tables, and the most a page can ask for
+app.config['RANK_PAGE_SIZE'] = 50
+app.config['RANK_MAX_PAGE_SIZE'] = 200
+# pragmas set on every new sqlite connection. WAL lets the leaderboards keep reading while a workout is being
+# saved, and busy_timeout makes a writer wait for its turn instead of failing with "database is locked"
+app.config['SQLITE_PRAGMAS'] = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',  # safe with WAL, only the last commits can be lost if the machine itself crashes
+    'busy_timeout': 15000,  # milliseconds, a waiting writer gives up after this long
+    'cache_size': -20000,  # negative means KiB, so about 20 MB per connection
+    'mmap_size': 268435456,  # 256 MB
+}
 db = SQLAlchemy(app)
 
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # other databases don't know these pragmas, so only sqlite connections get them
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in app.config['SQLITE_PRAGMAS'].items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+    cursor.close()
+
+
+def utc_now():
+    # the current time in UTC without the timezone attached. sqlite would save a timezone aware time as written but
+    # postgres converts it to its own timezone, so only plain UTC times are saved the same everywhere.
+    # it is used as a callable default so every row gets the time it was saved at
+    return datetime.now(pytz.utc).replace(tzinfo=None)
+
+
+def eastern_today():
+    # the days for the once a day limits start at midnight eastern time
+    return datetime.now(pytz.timezone('US/Eastern')).date()
+
+
+def eastern_date(moment):
+    # the eastern date of a time saved by utc_now
+    return pytz.utc.localize(moment).astimezone(pytz.timezone('US/Eastern')).date()
+
+
+def eastern_day_start(day):
+    # the time, as utc_now saves it, that an eastern date starts at
+    start = pytz.timezone('US/Eastern').localize(datetime.combine(day, datetime.min.time()))
+    return start.astimezone(pytz.utc).replace(tzinfo=None)
+
+
+############################################ Static files ###########################################
+# python build_static.py makes copies of the files in static/ with a hash of their content in the name, smaller
+# webp/avif pictures and gzip/brotli copies of the css, and lists them in static/build/manifest.json. when it has
+# been run url_for('static', filename='style.css') gives the copy, and as a copy never changes browsers can keep
+# it for a year. without the build the original files are served like before
+app.config['STATIC_MANIFEST'] = os.path.join(app.static_folder, 'build', 'manifest.json')
+app.config['STATIC_BUILD_MAX_AGE'] = 31536000  # a year, in seconds
+
+
+def load_static_manifest():
+    try:
+        with open(app.config['STATIC_MANIFEST']) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {'files': {}, 'precompressed': {}}
+
+static_manifest = load_static_manifest()
+
+
+@app.url_defaults
+def fingerprinted_static_url(endpoint, values):
+    if endpoint == 'static' and values.get('filename') in static_manifest['files']:
+        values['filename'] = static_manifest['files'][values['filename']]
+
+
+@app.before_request
+def precompressed_static():
+    # sends the brotli or gzip copy made by the build when the browser accepts it, best one first
+    if request.endpoint != 'static':
+        return None
+    filename = request.view_args['filename']
+    for encoding in ('br', 'gzip'):
+        # a quality of 0 means the browser refuses that encoding
+        if encoding in static_manifest['precompressed'].get(filename, []) and request.accept_encodings[encoding] > 0:
+            suffix = '.br' if encoding == 'br' else '.gz'
+            response = send_from_directory(app.static_folder, filename + suffix,
+                                           mimetype=mimetypes.guess_type(filename)[0])
+            response.headers['Content-Encoding'] = encoding
+            return response
+    return None
+
+
+@app.after_request
+def cache_built_static(response):
+    # everything the build makes has its hash in the name, except the manifest itself
+    filename = request.view_args.get('filename', '') if request.endpoint == 'static' else ''
+    # only files that were found, a 404 (e.g. from a worker that doesn't have the new build yet) must not be kept a year
+    if filename.startswith('build/') and filename != 'build/manifest.json' and response.status_code in (200, 304):
+        response.headers['Cache-Control'] = f"public, max-age={app.config['STATIC_BUILD_MAX_AGE']}, immutable"
+        if static_manifest['precompressed'].get(filename):
+            response.vary.add('Accept-Encoding')
+    return response
+
+
 ############################################ Register users ###########################################
 class User(UserMixin, db.Model):
     # usermixin is use to get the user id, ensures they are authenticated, and keep track of their activeness
     # create the column for the database
     id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(10), nullable=False, unique=True)
-    password = db.Column(db.String(80), nullable=False)
-    first_name = db.Column(db.String(10), nullable=False)
-    last_name = db.Column(db.String(10), nullable=False)
-    user_email = db.Column(db.String(10), nullable=False, unique=True)
+    # sqlite never checked these lengths but other databases do, so they fit real names, emails and password hashes
+    username = db.Column(db.String(80), nullable=False, unique=True)
+    password = db.Column(db.String(255), nullable=False)
+    first_name = db.Column(db.String(80), nullable=False)
+    last_name = db.Column(db.String(80), nullable=False)
+    user_email = db.Column(db.String(120), nullable=False, unique=True)
     is_active = db.Column(db.Boolean, default=True)
-    eastern_time = pytz.timezone('US/Eastern')
-    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now(tz=eastern_time))
-    last_login = db.Column(db.DateTime, nullable=False, default=datetime.now(tz=eastern_time))
+    created_at = db.Column(db.DateTime, nullable=False, default=utc_now)
+    last_login = db.Column(db.DateTime, nullable=False, default=utc_now)
     login_count = db.Column(db.Integer, default=1, nullable=True)
     
 
+############################################ Workout categories ###########################################
+# every kind of workout the app tracks, adding a new one only takes a new entry here:
+#   name         - shown on the thank you pages
+#   form_fields  - the form inputs that are added up into the user's total for the day
+#   thank_you    - 'course' for the workout course pages, 'video' for the workout video pages
+#   rank_url, rank_endpoint, rank_title - the page with the full rank table
+#   submit_url, submit_endpoint - (optional) where the form is sent when it isn't sent back to its own page
+workout_categories = {
+    'gain_muscle': {
+        'name': 'Gain Muscle',
+        'form_fields': [f'gain_workout_{number}' for number in range(1, 9)],
+        'thank_you': 'course',
+        'rank_url': '/rank', 'rank_endpoint': 'rank', 'rank_title': 'Gain Muscle Ranks',
+    },
+    'lose_weight': {
+        'name': 'Lose Weight',
+        'form_fields': [f'lose_workout_{number}' for number in range(1, 9)],
+        'thank_you': 'course',
+        'rank_url': '/lose weight rank', 'rank_endpoint': 'lose_weight_rank', 'rank_title': 'Lose Weight Ranks',
+    },
+    'yoga': {
+        'name': 'Yoga',
+        'form_fields': ['first_yoga_vid', 'second_yoga_vid', 'third_yoga_vid'],
+        'thank_you': 'video',
+        'rank_url': '/yoga rank', 'rank_endpoint': 'yoga_rank', 'rank_title': 'Daily Yoga Ranks',
+        'submit_url': '/workout_yoga', 'submit_endpoint': 'yoga_workout_funct',
+    },
+    'cardio': {
+        'name': 'Cardio',
+        'form_fields': ['first_cardio_vid', 'second_cardio_vid', 'third_cardio_vid'],
+        'thank_you': 'video',
+        'rank_url': '/cardio rank', 'rank_endpoint': 'cardio_rank', 'rank_title': 'Daily Cardio Rank',
+        'submit_url': '/workout_cardio', 'submit_endpoint': 'cardio_workout_funct',
+    },
+    'hiit': {
+        'name': 'Hiit',
+        'form_fields': ['first_hiit_vid', 'second_hiit_vid', 'third_hiit_vid'],
+        'thank_you': 'video',
+        'rank_url': '/hiit rank', 'rank_endpoint': 'hiit_rank', 'rank_title': 'Daily Hiit Ranks',
+        'submit_url': '/workout_hiit', 'submit_endpoint': 'hiit_workout_funct',
+    },
+}
+
+
+# every workout submitted by every user, the category says which kind of workout it was
+class workout(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    category = db.Column(db.String(20), nullable=False)
+    # how many of the workouts the user did
+    amount = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=utc_now)
+    # the eastern date it was submitted on, the database turns away a second workout in the same category that day
+    local_date = db.Column(db.Date, nullable=False, default=eastern_today)
+    __table_args__ = (db.Index('uq_workout_user_category_day', 'user_id', 'category', 'local_date', unique=True),)
+
+
+def submit_workout(category):
+    # saves the workout form the current user sent for a category, and sends them to the right thank you page
+    settings = workout_categories[category]
+
+    # the same day time in eastern time zone
+    same_day = eastern_today()
+
+    # a course page left open past midnight was showing yesterday's plan, the ticks can't be saved against today's
+    # plan so the user gets sent back to today's with a message saying why
+    if category in course_exercises and request.form.get('plan_day') != same_day.isoformat():
+        return redirect(url_for(request.endpoint, old_plan=request.form.get('plan_day', '')))
+
+    if category in course_exercises:
+        # only the ticked boxes for the workouts in the plan the user was shown count
+        plan = daily_plan(current_user.id, category, same_day)
+        total = sum(request.form.get(field) == '1' for field, _ in zip(settings['form_fields'], plan))
+    else:
+        # adds up the inputs for all the workouts to get the total, if they didn't do one it is marked as 0
+        total = sum(int(request.form.get(field, 0)) for field in settings['form_fields'])
+
+    # adds that information to the database along with any other forms sent at the same time, it is refused
+    # if the user has already submitted this workout form in the current day, even when both forms arrive at once
+    if not workout_ingest.submit(current_user.id, category, total, same_day):
+        # if so returns a sorry page
+        return redirect(url_for('workout_sorry'))
+
+    return thank_you_redirect(category, total)
+
+
+def thank_you_redirect(category, total):
+    # returns a thank you page base on the amount of workout the user submits
+    settings = workout_categories[category]
+    all_done = len(settings['form_fields'])
+
+    # the workout courses thank the user for how many workouts they did, or for doing all of them
+    if settings['thank_you'] == 'course':
+        if 1 <= total < all_done:
+            return redirect(url_for('thankyou_course', total=total))
+        elif total == all_done:
+            return redirect(url_for('thankyou_course', total='all'))
+        return redirect(url_for('thanks_none'))
+
+    # the workout videos have a thank you page for each number of videos watched
+    if 1 <= total <= 3:
+        return redirect(url_for(f'thanks_workout_{total}', workout_type=settings['name']))
+    return redirect(url_for('thanks_none', workout_type=settings['name']))
+
+
+############################################ Workout ingest ###########################################
+# at busy times lots of workout forms arrive together and sqlite can only commit one at a time, so the forms are
+# handed to one thread that saves whatever has arrived in a single transaction. it waits WORKOUT_BATCH_SECONDS
+# for more forms to join a batch, and saves at most WORKOUT_BATCH_SIZE forms in one go
+app.config['WORKOUT_BATCH_SECONDS'] = 0.002
+app.config['WORKOUT_BATCH_SIZE'] = 200
+
+
+class WorkoutIngest:
+    # the request threads put their workout on the queue and wait for their own answer,
+    # so every user still gets the right thank you or sorry page
+    def __init__(self):
+        self.submissions = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, user_id, category, amount, local_date):
+        # returns True once the workout is saved, or False if the user already submitted this workout that day
+        self.start()
+        # gives the request's database connection back to the pool first, otherwise a crowd of waiting
+        # requests can hold every connection and the ingest thread can never save their batch
+        db.session.close()
+        result = Future()
+        self.submissions.put(((user_id, category, amount, local_date), result))
+        return result.result()
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='workout-ingest', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            batch = [self.submissions.get()]
+            deadline = time.monotonic() + app.config['WORKOUT_BATCH_SECONDS']
+            while len(batch) < app.config['WORKOUT_BATCH_SIZE']:
+                try:
+                    batch.append(self.submissions.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+
+            try:
+                with app.app_context():
+                    saved = save_workouts([submission for submission, _ in batch])
+            except Exception as error:
+                for _, result in batch:
+                    result.set_exception(error)
+                continue
+            for (_, result), was_saved in zip(batch, saved):
+                if isinstance(was_saved, Exception):
+                    result.set_exception(was_saved)
+                else:
+                    result.set_result(was_saved)
+
+
+def save_workouts(submissions):
+    # saves a batch of (user_id, category, amount, local_date) workouts and their leaderboard totals in one
+    # transaction, and returns whether each one was saved. a workout the user already submitted that day isn't,
+    # and one that failed on its own gets its exception instead
+    try:
+        saved = save_workout_batch(submissions)
+    except IntegrityError:
+        # another worker saved one of the same workouts in the meantime, so they are sorted out one at a time
+        db.session.rollback()
+        saved = []
+        for submission in submissions:
+            try:
+                saved.append(save_single_workout(submission))
+            except Exception as error:
+                # the ones before it are already saved, so only this user gets the error
+                db.session.rollback()
+                saved.append(error)
+
+    # the users' summary pages have to be worked out again
+    for (user_id, _, _, _), was_saved in zip(submissions, saved):
+        if was_saved is True:
+            forget_user_stats(user_id)
+    return saved
+
+
+def save_workout_batch(submissions):
+    # the workouts already saved for these users and days, the unique index would refuse them
+    taken = set(db.session.execute(
+        select(workout.user_id, workout.category, workout.local_date)
+        .where(workout.user_id.in_({user_id for user_id, _, _, _ in submissions}),
+               workout.local_date.in_({local_date for _, _, _, local_date in submissions}))
+    ).all())
+
+    saved = []
+    for user_id, category, amount, local_date in submissions:
+        # two forms for the same workout in one batch, only the first one counts
+        saved.append((user_id, category, local_date) not in taken)
+        taken.add((user_id, category, local_date))
+
+    new_workouts = [submission for submission, was_saved in zip(submissions, saved) if was_saved]
+    if new_workouts:
+        now = utc_now()
+        db.session.execute(insert(workout), [
+            {'user_id': user_id, 'category': category, 'amount': amount, 'local_date': local_date, 'created_at': now}
+            for user_id, category, amount, local_date in new_workouts
+        ])
+        amounts = {}
+        for user_id, category, amount, _ in new_workouts:
+            amounts[(category, user_id)] = amounts.get((category, user_id), 0) + amount
+        add_to_leaderboard(amounts)
+    db.session.commit()
+    return saved
+
+
+def save_single_workout(submission):
+    # saves one workout in its own transaction, False means the user already submitted it that day
+    user_id, category, _, local_date = submission
+    for _ in range(3):
+        try:
+            return save_workout_batch([submission])[0]
+        except IntegrityError:
+            db.session.rollback()
+            # the workout is there, so it was a second submission. otherwise it was the leaderboard row for a
+            # first submission being added by another worker at the same time, and trying again finds it
+            if db.session.execute(select(workout.id).filter_by(user_id=user_id, category=category, local_date=local_date)).first():
+                return False
+    raise RuntimeError(f'Could not save the {category} workout for user {user_id}')
+
+
+workout_ingest = WorkoutIngest()
+
+
+############################################ Leaderboard totals ###########################################
+# keeps a running total of every user's workouts for each category in workout_categories
+# so the leaderboards read one row per user instead of adding up every workout ever submitted
+class leaderboard_total(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    category = db.Column(db.String(20), nullable=False)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    # a user only has one running total per category
+    __table_args__ = (db.UniqueConstraint('category', 'user_id', name='uq_leaderboard_category_user'),)
+
+# the top users and a single user's rank for a category are read straight off this index
+db.Index('ix_leaderboard_category_total', leaderboard_total.category, leaderboard_total.total.desc(), leaderboard_total.user_id)
+# and the summary page reads all of one user's totals off this one
+db.Index('ix_leaderboard_user', leaderboard_total.user_id)
+
+
+def add_to_leaderboard(amounts):
+    # adds the workouts just submitted onto the users' running totals, e.g. {('yoga', 12): 3, ('hiit', 40): 1},
+    # this is called before the submissions are committed so the workouts and the new totals are saved in the
+    # same transaction. the totals are incremented inside the UPDATE so two submissions at once can't overwrite each other
+    totals = leaderboard_total.__table__
+    existing = set(db.session.execute(
+        select(totals.c.category, totals.c.user_id).where(totals.c.user_id.in_({user_id for _, user_id in amounts}))
+    ).all())
+
+    changes = [{'category_key': category, 'user_key': user_id, 'amount': amount}
+               for (category, user_id), amount in amounts.items() if (category, user_id) in existing]
+    if changes:
+        db.session.execute(
+            update(totals)
+            .where(totals.c.category == bindparam('category_key'), totals.c.user_id == bindparam('user_key'))
+            .values(total=totals.c.total + bindparam('amount')),
+            changes,
+        )
+
+    # first submission in this category, so the user gets a new row
+    new_rows = [{'category': category, 'user_id': user_id, 'total': amount}
+                for (category, user_id), amount in amounts.items() if (category, user_id) not in existing]
+    if new_rows:
+        db.session.execute(insert(totals), new_rows)
+
+
+def leaderboard_top(category, user_id, limit=3):
+    # gets only the top users of a category plus the given user's own rank and total,
+    # so the workout pages never load the whole ranking just to show the top 3
+    top_users = db.session.query(
+        User.username,
+        leaderboard_total.total.label('total_workouts')
+    ).join(User, User.id == leaderboard_total.user_id
+    ).filter(leaderboard_total.category == category
+    ).order_by(leaderboard_total.total.desc(), leaderboard_total.user_id
+    ).limit(limit).all()
+
+    user_rank, user_total = leaderboard_user_rank(category, user_id)
+    return top_users, user_rank, user_total
+
+
+def leaderboard_user_rank(category, user_id):
+    # the user's rank is 1 + how many users are ahead of them, users ahead have a higher total
+    # or the same total and signed up earlier (the same order the full rank tables use)
+    mine = aliased(leaderboard_total)
+    ahead = select(func.count()).where(
+        leaderboard_total.category == mine.category,
+        or_(leaderboard_total.total > mine.total,
+            and_(leaderboard_total.total == mine.total, leaderboard_total.user_id < mine.user_id))
+    ).scalar_subquery()
+
+    own_rank = db.session.query(mine.total, ahead).filter(mine.category == category, mine.user_id == user_id).first()
+
+    # the user hasn't submitted anything in this category yet
+    if own_rank is None:
+        return None, None
+    user_total, users_ahead = own_rank
+    return users_ahead + 1, user_total
+
+
+def leaderboard_page(category, after=None, before=None, page_size=50):
+    # gets one page of the full rank table using the last row of the page before as a bookmark (keyset pagination),
+    # a bookmark is (total, user_id, rank) so the database jumps straight to it on the leaderboard index
+    # and each page only ever reads page_size rows no matter how many users there are
+    query = db.session.query(
+        leaderboard_total.user_id,
+        User.username,
+        leaderboard_total.total
+    ).join(User, User.id == leaderboard_total.user_id
+    ).filter(leaderboard_total.category == category)
+
+    if before is not None:
+        # going back a page: read the rows just above the bookmark in reverse, then flip them back
+        total, user_id, rank = before
+        rows = query.filter(
+            or_(leaderboard_total.total > total, and_(leaderboard_total.total == total, leaderboard_total.user_id < user_id))
+        ).order_by(leaderboard_total.total.asc(), leaderboard_total.user_id.desc()).limit(page_size + 1).all()
+        has_more_before = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        # with nobody above the page it starts at rank 1, whatever rank the bookmark says
+        first_rank = max(rank - len(rows), 2) if has_more_before else 1
+        has_more_after = True
+    else:
+        query = query.order_by(leaderboard_total.total.desc(), leaderboard_total.user_id)
+        if after is not None:
+            # going forward a page: start right after the last row of the previous page
+            total, user_id, rank = after
+            query = query.filter(
+                or_(leaderboard_total.total < total, and_(leaderboard_total.total == total, leaderboard_total.user_id > user_id))
+            )
+            first_rank = rank + 1
+        else:
+            first_rank = 1
+        # reads one extra row to know if there is another page after this one
+        rows = query.limit(page_size + 1).all()
+        has_more_after = len(rows) > page_size
+        rows = rows[:page_size]
+        has_more_before = first_rank > 1
+
+    return leaderboard_page_result(rows, first_rank, has_more_before, has_more_after)
+
+
+def leaderboard_page_around(category, user_id, page_size=50):
+    # "jump to my position": a page with the user in the middle of it
+    user_rank, user_total = leaderboard_user_rank(category, user_id)
+
+    # the user isn't on the leaderboard yet so it just shows the first page
+    if user_rank is None:
+        return leaderboard_page(category, page_size=page_size)
+
+    # the users just above the current user, then the current user and the users below them
+    # (the "after" bookmark starts from user_id - 1 so the current user is the first row of the second half)
+    above = leaderboard_page(category, before=(user_total, user_id, user_rank), page_size=page_size // 2)
+    below = leaderboard_page(category, after=(user_total, user_id - 1, user_rank - 1), page_size=page_size - len(above['rows']))
+    # near the bottom there aren't enough users below, so the page is filled up with more of the users above
+    if len(above['rows']) + len(below['rows']) < page_size and above['prev'] is not None:
+        above = leaderboard_page(category, before=(user_total, user_id, user_rank), page_size=page_size - len(below['rows']))
+
+    rows = [(row['user_id'], row['username'], row['total']) for row in above['rows'] + below['rows']]
+    first_rank = user_rank - len(above['rows'])
+    return leaderboard_page_result(rows, first_rank, first_rank > 1, below['next'] is not None)
+
+
+def leaderboard_page_result(rows, first_rank, has_more_before, has_more_after):
+    # numbers the rows and builds the bookmarks for the previous and next pages
+    ranked = [
+        {'rank': rank, 'user_id': user_id, 'username': username, 'total': total}
+        for rank, (user_id, username, total) in enumerate(rows, start=first_rank)
+    ]
+    prev_cursor = None
+    next_cursor = None
+    if ranked and has_more_before:
+        prev_cursor = f"{ranked[0]['total']},{ranked[0]['user_id']},{ranked[0]['rank']}"
+    if ranked and has_more_after:
+        next_cursor = f"{ranked[-1]['total']},{ranked[-1]['user_id']},{ranked[-1]['rank']}"
+    return {'rows': ranked, 'prev': prev_cursor, 'next': next_cursor}
+
+
+def parse_rank_cursor(cursor):
+    # turns a "total,user_id,rank" bookmark from the url back into numbers, a broken one just means no bookmark
+    try:
+        total, user_id, rank = (int(part) for part in cursor.split(','))
+    except (AttributeError, ValueError):
+        return None
+    # the rank comes from the url, the bookmarked row is at least 1st so the table never shows 0 or negative ranks
+    return total, user_id, max(rank, 1)
+
+
+def render_rank_table(category):
+    # the full rank tables are shown a page at a time
+    page_size = request.args.get('page_size', app.config['RANK_PAGE_SIZE'], type=int)
+    page_size = max(1, min(page_size, app.config['RANK_MAX_PAGE_SIZE']))
+
+    # ?me=1 jumps to the page with the current user on it, otherwise it follows the previous/next bookmarks
+    if request.args.get('me'):
+        page = leaderboard_page_around(category, current_user.id, page_size)
+    else:
+        page = leaderboard_page(category, after=parse_rank_cursor(request.args.get('after')),
+                                before=parse_rank_cursor(request.args.get('before')), page_size=page_size)
+
+    #zipped the data so that they can be iterated through all at once on the html page
+    zipped_data = [(row['rank'], row['username'], row['total']) for row in page['rows']]
+
+    return render_template('/rank_tables/rank.html', title=workout_categories[category]['rank_title'],
+                           zipped_data=zipped_data, current_username=current_user.username,
+                           prev_cursor=page['prev'], next_cursor=page['next'], page_size=page_size)
+
+
+def category_view(view, category):
+    # makes a logged in only page that runs view(category)
+    @login_required
+    def category_page():
+        return view(category)
+    return category_page
+
+
+# every category gets a full rank table page, and its own page for the workout form if it has one
+for category, settings in workout_categories.items():
+    app.add_url_rule(settings['rank_url'], settings['rank_endpoint'], category_view(render_rank_table, category))
+    if 'submit_url' in settings:
+        app.add_url_rule(settings['submit_url'], settings['submit_endpoint'], category_view(submit_workout, category),
+                         methods=['POST'])
+
+
+############################################ Passwords ###########################################
+# bcrypt by default, or any method werkzeug knows written the way it saves it (e.g. 'scrypt:32768:8:1'),
+# and how many bcrypt rounds to use, every extra round doubles the time a hash takes
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'bcrypt')
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+# hashing is slow on purpose, so only this many hashes run at once and the rest of the site keeps its cpu.
+# a request waits at most PASSWORD_WAIT_SECONDS for its turn before it gets a "try again" page
+app.config['PASSWORD_WORKERS'] = int(os.environ.get('PASSWORD_WORKERS', 2))
+app.config['PASSWORD_WAIT_SECONDS'] = 10
+bcrypt = Bcrypt(app)
+
+password_pool = ThreadPoolExecutor(max_workers=app.config['PASSWORD_WORKERS'], thread_name_prefix='password')
+# room for the hashes running plus a queue of waiting ones, a login storm past that is turned away straight away
+password_slots = threading.BoundedSemaphore(app.config['PASSWORD_WORKERS'] * 8)
+
+
+class PasswordServiceBusy(Exception):
+    pass
+
+
+def run_password_job(job, *args):
+    # runs a hash on the password pool and waits for the answer. the request's database connection goes back to
+    # the pool first, like in WorkoutIngest.submit, so a crowd of logins waiting here can't hold every connection
+    # and stall the pages that read the database. rows already loaded can still be read, but changes that weren't
+    # committed are dropped, so the hash has to be made before a new row is added
+    db.session.close()
+    if not password_slots.acquire(timeout=app.config['PASSWORD_WAIT_SECONDS']):
+        raise PasswordServiceBusy()
+    try:
+        return password_pool.submit(job, *args).result()
+    finally:
+        password_slots.release()
+
+
+def hash_password(password):
+    # hashes a new password with the method and cost set in the config
+    if app.config['PASSWORD_HASH_METHOD'] == 'bcrypt':
+        return run_password_job(bcrypt.generate_password_hash, password, app.config['BCRYPT_LOG_ROUNDS']).decode()
+    return run_password_job(generate_password_hash, password, app.config['PASSWORD_HASH_METHOD'])
+
+
+def verify_password(password_hash, password):
+    # checks a password against a saved hash, bcrypt hashes start with $2 and the others are werkzeug's
+    if password_hash.startswith('$2'):
+        return run_password_job(bcrypt.check_password_hash, password_hash, password)
+    return run_password_job(check_password_hash, password_hash, password)
+
+
+# what a werkzeug hash made with each method starts with, by method
+werkzeug_hash_prefixes = {}
+
+
+def password_needs_rehash(password_hash):
+    # whether a saved hash was made with a different method or cost than the config asks for now
+    method = app.config['PASSWORD_HASH_METHOD']
+    if method == 'bcrypt':
+        # a bcrypt hash looks like $2b$12$..., the 12 is the rounds
+        return not password_hash.startswith('$2') or password_hash.split('$')[2] != f"{app.config['BCRYPT_LOG_ROUNDS']:02d}"
+    # werkzeug saves the method with its costs filled in ('scrypt' becomes scrypt:32768:8:1), so the prefix to
+    # compare with comes from hashing a throwaway password once
+    if method not in werkzeug_hash_prefixes:
+        werkzeug_hash_prefixes[method] = generate_password_hash('prefix', method).split('$', 1)[0]
+    return password_hash.split('$', 1)[0] != werkzeug_hash_prefixes[method]
+
+
+@app.errorhandler(PasswordServiceBusy)
+def password_service_busy(error):
+    return 'Too many people are logging in right now, please try again in a few seconds.', 503, {'Retry-After': '5'}
+
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
@@ -77,7 +722,7 @@ def register():
         
         
         # hashes the password
-        hashed_password = generate_password_hash(password)
+        hashed_password = hash_password(password)
 
         # Create a new user
         new_user = User(username=username, password=hashed_password, first_name=first_name, last_name=last_name, user_email=email)
@@ -100,11 +745,131 @@ def register():
 login_manager = LoginManager()
 login_manager.init_app(app)
 
+# every logged in page looks up the user, so a copy of their details is kept for a short while instead of reading
+# the user table on each request. changing the details or logging out forgets the copy straight away, other
+# workers only find out when their copy gets too old
+app.config['SESSION_USER_CACHE_SECONDS'] = 30
+app.config['SESSION_USER_CACHE_SIZE'] = 10000
+
+session_user_cache = {}
+session_user_lock = threading.Lock()
+
+
+class SessionUser(UserMixin):
+    # the details of a user that the pages show, copied off the user table so they don't need a database session.
+    # handlers that change the user (e.g. their password) load the full row with User.query.get(current_user.id)
+    is_active = True
+
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.first_name = user.first_name
+        self.last_name = user.last_name
+        self.user_email = user.user_email
+        self.login_count = user.login_count
+        self.is_active = user.is_active
+
+
 # User loader function, by loading user object from their id in the database
 @login_manager.user_loader
 def load_user(user_id):
+    user_id = int(user_id)
+    now = time.monotonic()
+    with session_user_lock:
+        cached = session_user_cache.pop(user_id, None)
+        if cached is not None and now - cached[1] < app.config['SESSION_USER_CACHE_SECONDS']:
+            # put back at the end, so the users that haven't been seen for the longest are the first forgotten
+            session_user_cache[user_id] = cached
+            return cached[0]
+
     # return  the user with the corresponding ID
-    return User.query.get(int(user_id))
+    user = User.query.get(user_id)
+    if user is None:
+        return None
+    session_user = SessionUser(user)
+    with session_user_lock:
+        if len(session_user_cache) >= app.config['SESSION_USER_CACHE_SIZE']:
+            session_user_cache.pop(next(iter(session_user_cache)))
+        session_user_cache[user_id] = (session_user, now)
+    return session_user
+
+
+def forget_session_user(user_id):
+    # called when the user's details change and when they log out
+    with session_user_lock:
+        session_user_cache.pop(user_id, None)
+
+# the time of each login and the count of days the user visited are saved in batches in the background,
+# every LOGIN_FLUSH_SECONDS or as soon as LOGIN_FLUSH_SIZE users are waiting, so logging in never waits on a write
+app.config['LOGIN_FLUSH_SECONDS'] = 5
+app.config['LOGIN_FLUSH_SIZE'] = 500
+
+# user_id -> {eastern date: the time of their latest login that day} since the last save
+pending_logins = {}
+pending_logins_lock = threading.Lock()
+login_flush_lock = threading.Lock()
+
+
+def record_login(user_id, when=None):
+    when = when or utc_now()
+    with pending_logins_lock:
+        days = pending_logins.setdefault(user_id, {})
+        day = eastern_date(when)
+        days[day] = max(days.get(day, when), when)
+        full = len(pending_logins) >= app.config['LOGIN_FLUSH_SIZE']
+    if full:
+        # saved straight away on the scheduler's thread
+        scheduler.add_job(flush_logins)
+
+
+def flush_logins():
+    # saves the waiting logins in one transaction, the login count only goes up once for each new day
+    with login_flush_lock:
+        with pending_logins_lock:
+            batch = dict(pending_logins)
+            pending_logins.clear()
+        if not batch:
+            return
+
+        # one row per user and day, oldest day first so each day is checked against the login before it
+        changes = [
+            {'user_key': user_id, 'day_start': eastern_day_start(day),
+             'day_end': eastern_day_start(day + timedelta(days=1)), 'latest': latest}
+            for user_id, days in batch.items() for day, latest in sorted(days.items())
+        ]
+        try:
+            with app.app_context():
+                # whether the day is new is decided inside the update from the saved last_login, so another worker
+                # saving the same day at the same time can't count it twice (the database runs the two updates one
+                # after the other and the second one sees the first one's last_login). logins saved by another
+                # worker in the meantime can be newer, so last_login never goes backwards
+                users = User.__table__
+                same_day = and_(users.c.last_login >= bindparam('day_start'), users.c.last_login < bindparam('day_end'))
+                db.session.execute(
+                    update(users).where(users.c.id == bindparam('user_key')).values(
+                        login_count=users.c.login_count + case((same_day, 0), else_=1),
+                        last_login=case((users.c.last_login < bindparam('latest'), bindparam('latest')), else_=users.c.last_login),
+                    ),
+                    changes,
+                )
+                db.session.commit()
+        except Exception as error:
+            # puts the logins back so the next flush tries them again
+            print(f'Saving {len(batch)} logins failed: {error}')
+            with pending_logins_lock:
+                for user_id, days in batch.items():
+                    waiting_days = pending_logins.setdefault(user_id, {})
+                    for day, latest in days.items():
+                        waiting_days[day] = max(waiting_days.get(day, latest), latest)
+            return
+
+    # the summary page shows the login count
+    for user_id in batch:
+        forget_session_user(user_id)
+
+
+# anything still waiting is saved when the app shuts down
+atexit.register(flush_logins)
 
 # Login route
 @app.route('/', methods=['GET', 'POST'])
@@ -118,17 +883,17 @@ def index():
         user = User.query.filter_by(username=username).first()
 
         # if the user exist it then compare the provided password with the hash verision in the database
-        if user and check_password_hash(user.password, password):
-            # Log the user into the session
+        if user and verify_password(user.password, password):
+            # a password saved with an older method or cost is hashed again now that we have it
+            if password_needs_rehash(user.password):
+                db.session.execute(update(User).where(User.id == user.id).values(password=hash_password(password)))
+                db.session.commit()
 
-            # if the user has login already within the same day
-            if user.last_login.date() != date.today():
-                # if not it increments login count(The days they visited)
-                user.login_count += 1
-                
-            # it then updates their last login time to the this current log in
-            user.last_login = datetime.now()
-            db.session.commit()
+            # updates their last login time to the this current log in, and the login count (the days they visited)
+            # if it is a new day. this is saved a few seconds later together with other logins
+            record_login(user.id)
+
+            # Log the user into the session
             login_user(user)
             return redirect(url_for('home'))
 
@@ -141,10 +906,33 @@ def index():
 @app.route('/logout')
 @login_required  # This decorator ensures that only logged in users can access this route
 def logout():
+    forget_session_user(current_user.id)
     logout_user()
     # when the user log out it just redirect them back to the login page
     return redirect(url_for('index'))
 
+#######################################################################################################
+##################################### Update account details ##########################################
+
+def update_user_details(user_id, changes):
+    # changes the user's account details (e.g. {'username': 'new_name'}) with one UPDATE keyed on their id,
+    # everything is committed together so a failed change leaves nothing half done
+    # the workout, review and report tables only keep the user id, so the user table is the only one rewritten
+    row_counts = {}
+    try:
+        row_counts['user'] = db.session.execute(update(User).where(User.id == user_id).values(**changes)).rowcount
+        db.session.commit()
+        # the pages show the user's details and the public reviews show usernames
+        forget_session_user(user_id)
+        clear_review_feed_cache()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    # returns how many rows were changed in each table so the size of the change can be logged
+    print(f'Updated {", ".join(changes)} for user {user_id}: {row_counts}')
+    return row_counts
+
 #######################################################################################################
 ##################################### Change Password #################################################
 
@@ -158,10 +946,10 @@ def change_password():
         confirm_password = request.form['confirm_password']
 
         # Get the current logged in user
-        user = current_user
+        user = User.query.get(current_user.id)
 
         # Check if the current password matches the user's existing password
-        if not check_password_hash(user.password, old_password):
+        if not verify_password(user.password, old_password):
             return render_template('/login/change_password.html', error='Current Password is incorrect!', form_data=request.form)
 
         # Check if the new password and the confirm new password are the same
@@ -169,11 +957,12 @@ def change_password():
             return render_template('/login/change_password.html', error_new='New Passwords do not match!', form_data=request.form)
 
         # Hash the new password
-        hashed_password = generate_password_hash(new_password)
+        hashed_password = hash_password(new_password)
 
         # Update the user's password in the database
-        user.password = hashed_password
+        db.session.execute(update(User).where(User.id == user.id).values(password=hashed_password))
         db.session.commit()
+        forget_session_user(user.id)
 
         return redirect(url_for('account'))
     else:
@@ -190,10 +979,10 @@ def change_username():
         new_username = request.form['new_username']
         password = request.form['password']
 
-        user = current_user
+        user = User.query.get(current_user.id)
 
         # check if the password given is the user password
-        if not check_password_hash(user.password, password):
+        if not verify_password(user.password, password):
             return render_template('/login/change_username.html', error='Password is incorrect!', form_data=request.form)
         
         # check if the user name already exists
@@ -202,38 +991,7 @@ def change_username():
             return render_template('/login/change_username.html', error='Username already taken!', form_data=request.form)
 
         # adds the username to the database
-        # Their username is changed in every table and every past submissions they made
-        current_username = current_user.username
-        gain_muscle_table = gain_muscle_data.query.filter_by(username=current_username).all()
-        for entry in gain_muscle_table:
-            entry.username = new_username
-
-        lose_weight_table = lose_weight_data.query.filter_by(username=current_username).all()
-        for entry in lose_weight_table:
-            entry.username = new_username
-
-        yoga_table = daily_yoga_workout.query.filter_by(username=current_username).all()
-        for entry in yoga_table:
-            entry.username = new_username
-
-        cardio_table = daily_cardio_workout.query.filter_by(username=current_username).all()
-        for entry in cardio_table:
-            entry.username = new_username
-
-        hiit_table = daily_hiit_workout.query.filter_by(username=current_username).all()
-        for entry in hiit_table:
-            entry.username = new_username
-
-        Review_table = Review.query.filter_by(username=current_username).all()
-        for entry in Review_table:
-            entry.username = new_username
-
-        Report_table = Report.query.filter_by(username=current_username).all()
-        for entry in Report_table:
-            entry.username = new_username
- 
-        user.username = new_username
-        db.session.commit()
+        update_user_details(user.id, {'username': new_username})
 
         # if successful I takes the user back to the index pages
         return redirect(url_for('account'))
@@ -251,10 +1009,10 @@ def change_email():
         new_email = request.form['new_email']
         password = request.form['password']
 
-        user = current_user
+        user = User.query.get(current_user.id)
 
         # check if the password given is the user password
-        if not check_password_hash(user.password, password):
+        if not verify_password(user.password, password):
             return render_template('/login/change_email.html', error='Password is incorrect!', form_data=request.form)
         
         # check if the email already exists
@@ -262,39 +1020,8 @@ def change_email():
         if existing_email:
             return render_template('/login/change_email.html', error='Email already exist!', form_data=request.form )
         
-        # update the user email in all tables within the database, even in their past submissions
-        current_email = current_user.user_email
-        gain_muscle_table = gain_muscle_data.query.filter_by(user_email=current_email).all()
-        for entry in gain_muscle_table:
-            entry.user_email = new_email
-
-        lose_weight_table = lose_weight_data.query.filter_by(user_email=current_email).all()
-        for entry in lose_weight_table:
-            entry.user_email = new_email
-
-        yoga_table = daily_yoga_workout.query.filter_by(user_email=current_email).all()
-        for entry in yoga_table:
-            entry.user_email = new_email
-
-        cardio_table = daily_cardio_workout.query.filter_by(user_email=current_email).all()
-        for entry in cardio_table:
-            entry.user_email = new_email
-
-        hiit_table = daily_hiit_workout.query.filter_by(user_email=current_email).all()
-        for entry in hiit_table:
-            entry.user_email = new_email
-
-        Review_table = Review.query.filter_by(user_email=current_email).all()
-        for entry in Review_table:
-            entry.user_email = new_email
-
-        Report_table = Report.query.filter_by(user_email=current_email).all()
-        for entry in Report_table:
-            entry.user_email = new_email
-        
-        # adds the username to the database 
-        user.user_email = new_email
-        db.session.commit()
+        # adds the email to the database
+        update_user_details(user.id, {'user_email': new_email})
 
         # if successful I takes the user back to the index pages
         return redirect(url_for('account'))
@@ -313,48 +1040,14 @@ def change_name():
         new_last_name = request.form['new_lname']
         password = request.form['password']
 
-        user = current_user
+        user = User.query.get(current_user.id)
 
         # check if the password given is the user password
-        if not check_password_hash(user.password, password):
+        if not verify_password(user.password, password):
             return render_template('/login/change_name.html', error='Password is incorrect!', form_data=request.form)
         
-        # updates the user last name in all the databases
-        current_last_name = current_user.last_name
-
-        gain_muscle_table = gain_muscle_data.query.filter_by(user_lastname=current_last_name).all()
-        for entry in gain_muscle_table:
-            entry.user_lastname = new_last_name
-
-        lose_weight_table = lose_weight_data.query.filter_by(user_lastname=current_last_name).all()
-        for entry in lose_weight_table:
-            entry.user_lastname = new_last_name
-
-        yoga_table = daily_yoga_workout.query.filter_by(user_lastname=current_last_name).all()
-        for entry in yoga_table:
-            entry.user_lastname = new_last_name
-
-        cardio_table = daily_cardio_workout.query.filter_by(user_lastname=current_last_name).all()
-        for entry in cardio_table:
-            entry.user_lastname = new_last_name
-
-        hiit_table = daily_hiit_workout.query.filter_by(user_lastname=current_last_name).all()
-        for entry in hiit_table:
-            entry.user_lastname = new_last_name
-
-        Review_table = Review.query.filter_by(user_lastname=current_last_name).all()
-        for entry in Review_table:
-            entry.user_lastname = new_last_name
-
-        Report_table = Report.query.filter_by(user_lastname=current_last_name).all()
-        for entry in Report_table:
-            entry.user_lastname = new_last_name
-      
-
-        # adds the name to the database 
-        user.first_name = new_first_name
-        user.last_name = new_last_name
-        db.session.commit()
+        # adds the name to the database
+        update_user_details(user.id, {'first_name': new_first_name, 'last_name': new_last_name})
 
         # if successful it takes the user back to the index pages
         return redirect(url_for('account'))
@@ -362,138 +1055,53 @@ def change_name():
         return render_template('/login/change_name.html', form_data={}) 
 
 
-########################################## Gain Muscles Workouts Generator ##############################################
-# list of catergorized exercsies
-gain_muscles_list1 = ['Push-Ups', 'Pike Push-Ups', 'Diamond Push-Ups', 'Tricep Push-Ups', 'Shoulder Tap Push-Up']
-gain_muscles_list2 = ['Chair Dips', 'Lateral Squats', 'Wall Sits', 'Squat Jacks', 'High Knee Lift' ]
-gain_muscles_list3 = ['Sit-Ups', 'Russian Twists', 'Heel Touches', 'Shoulder Bridge', 'Sprinter Sit-Ups']
-gain_muscles_list4 = ['Mountain Climbers', 'Burpee', 'Handstand Push-Ups', 'Inchworm', 'Donkey Kicks']
-gain_muscles_list5 = ['Superman Lifts', 'Plank', 'Side Plank', 'Reverse Planks', 'Plank Hip Dips']
-gain_muscles_list6 = ['Leg Raises', 'Calf Raises', 'Glute Bridges', 'Single Leg Lifts', 'Side-Lying Leg Raise']
-gain_muscles_list7 = ['Reverse Crunches', 'Cross Crunches', 'Vertical Leg Crunch', 'Butterfly Crunches', 'Crunches']
-gain_muscles_list8 = ['Jumping Lunges', 'Walking Lunges', 'Forward Lunges', 'Front to Back Lunge', 'Curtsy Lunge']
-
-def get_gain_pushups():
-    random.shuffle(gain_muscles_list1)
-    return gain_muscles_list1[:1]
-
-def get_gain_standing():
-    random.shuffle(gain_muscles_list2)
-    return gain_muscles_list2[:1]
+########################################## Exercise Plan Generator ##############################################
+# picks one exercise from every slot of a workout course in a single call. the exercise lists are tuples so
+# nothing can shuffle them in place, and no two threads ever pick with the same random generator.
+# giving a seed makes a fresh generator for it, so the same seed always gives the same plan back
+exercise_randoms = threading.local()
 
-def get_gain_floor():
-    random.shuffle(gain_muscles_list3)
-    return gain_muscles_list3[:1]
-
-def get_gain_body():
-    random.shuffle(gain_muscles_list4)
-    return gain_muscles_list4[:1]
-
-def get_gain_planks():
-    random.shuffle(gain_muscles_list5)
-    return gain_muscles_list5[:1]
-
-def get_gain_raises():
-    random.shuffle(gain_muscles_list6)
-    return gain_muscles_list6[:1]
+def generate_exercise_plan(exercise_slots, seed=None):
+    if seed is None:
+        # building a generator costs more than the picks, so each thread keeps one for unseeded plans
+        rng = getattr(exercise_randoms, 'rng', None)
+        if rng is None:
+            rng = exercise_randoms.rng = random.Random()
+    else:
+        rng = random.Random(seed)
+    return tuple(rng.choice(slot) for slot in exercise_slots)
 
-def get_gain_crunches():
-    random.shuffle(gain_muscles_list7)
-    return gain_muscles_list7[:1]
 
-def get_gain_lunges():
-    random.shuffle(gain_muscles_list8)
-    return gain_muscles_list8[:1]
+########################################## Gain Muscles Workouts Generator ##############################################
+# list of catergorized exercsies, one tuple for each of the 8 workouts on the page
+gain_muscles_exercises = (
+    ('Push-Ups', 'Pike Push-Ups', 'Diamond Push-Ups', 'Tricep Push-Ups', 'Shoulder Tap Push-Up'),
+    ('Chair Dips', 'Lateral Squats', 'Wall Sits', 'Squat Jacks', 'High Knee Lift'),
+    ('Sit-Ups', 'Russian Twists', 'Heel Touches', 'Shoulder Bridge', 'Sprinter Sit-Ups'),
+    ('Mountain Climbers', 'Burpee', 'Handstand Push-Ups', 'Inchworm', 'Donkey Kicks'),
+    ('Superman Lifts', 'Plank', 'Side Plank', 'Reverse Planks', 'Plank Hip Dips'),
+    ('Leg Raises', 'Calf Raises', 'Glute Bridges', 'Single Leg Lifts', 'Side-Lying Leg Raise'),
+    ('Reverse Crunches', 'Cross Crunches', 'Vertical Leg Crunch', 'Butterfly Crunches', 'Crunches'),
+    ('Jumping Lunges', 'Walking Lunges', 'Forward Lunges', 'Front to Back Lunge', 'Curtsy Lunge'),
+)
 
 
 ################################ Back-end for the gain_muscle #################################
-class gain_muscle_data(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    username = db.Column(db.String(10), nullable=False)
-    user_lastname = db.Column(db.String(10), nullable=False)
-    user_email = db.Column(db.String(10), nullable=False)
-    gain_muscle = db.Column(db.Integer, nullable=True)
-    eastern_time = pytz.timezone('US/Eastern')
-    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now(tz=eastern_time))
-
 @app.route('/gain_muscles', methods=['GET', 'POST'])
 @login_required
 def gain_muscles():
     username = current_user.username
 
-    #gets the random workouts from the array list fucntions
-    random_gain_workoutset1 = get_gain_pushups()[0]
-    random_gain_workoutset2 = get_gain_standing()[0]
-    random_gain_workoutset3 = get_gain_floor()[0]
-    random_gain_workoutset4 = get_gain_body()[0]
-    random_gain_workoutset5 = get_gain_planks()[0]
-    random_gain_workoutset6 = get_gain_raises()[0]
-    random_gain_workoutset7 = get_gain_crunches()[0]
-    random_gain_workoutset8 = get_gain_lunges()[0]
-
-
     if request.method == 'POST':
-        # gets the amout of workout the user did, if they don't it markes it as 0
-        workout_1 = int(request.form.get('gain_workout_1', 0))
-        workout_2 = int(request.form.get('gain_workout_2', 0))
-        workout_3 = int(request.form.get('gain_workout_3', 0))
-        workout_4 = int(request.form.get('gain_workout_4', 0))
-        workout_5 = int(request.form.get('gain_workout_5', 0))
-        workout_6 = int(request.form.get('gain_workout_6', 0))
-        workout_7 = int(request.form.get('gain_workout_7', 0))
-        workout_8 = int(request.form.get('gain_workout_8', 0))
-
-        # checks the gain_muscle_data database to retrive the last time the current user submitted a daily_workout form
-        last_submission = gain_muscle_data.query.filter_by(user_id=current_user.id).order_by(gain_muscle_data.created_at.desc()).first()
-
-        # the same day time in eastern time zone
-        same_day = datetime.now(pytz.timezone('US/Eastern')).date()
-
-        # Checks if the user has already submitted a form in the current day
-        if last_submission and last_submission.created_at.date() == same_day:
-            # if so returns a sorry page
-            return redirect(url_for('workout_sorry'))
-        
-        # adds up the inputs for all the gain_muscles workouts to get the total
-        gain_muscle = workout_1 + workout_2 + workout_3 + workout_4 + workout_5 + workout_6 + workout_7 + workout_8
+        # saves the workouts the user did and takes them to a thank you page
+        return submit_workout('gain_muscle')
 
-        # the the function input to the current user data with the number of workout they did
-        gain_muscle_workout = gain_muscle_data(user_id=current_user.id, username=current_user.username, 
-                    user_lastname=current_user.last_name, user_email=current_user.user_email, gain_muscle=gain_muscle)
-        
-        # adds that information to the database
-        db.session.add(gain_muscle_workout)
-        db.session.commit()
-        
-        # returns a thank you page base on the amount of workout the user submits
-        if gain_muscle == 1:       
-            return redirect(url_for('thankyou_course', total=gain_muscle))
-        elif gain_muscle == 2: 
-            return redirect(url_for('thankyou_course', total=gain_muscle))
-        elif gain_muscle == 3:
-            return redirect(url_for('thankyou_course', total=gain_muscle))
-        elif gain_muscle == 4:
-            return redirect(url_for('thankyou_course', total=gain_muscle))
-        elif gain_muscle == 5:
-            return redirect(url_for('thankyou_course', total=gain_muscle))
-        elif gain_muscle == 6:
-            return redirect(url_for('thankyou_course', total=gain_muscle))
-        elif gain_muscle == 7:
-            return redirect(url_for('thankyou_course', total=gain_muscle))
-        elif gain_muscle == 8:
-            return redirect(url_for('thankyou_course', total='all'))
-        else:
-            return redirect(url_for('thanks_none'))
-        
-    # Query to get the usernames of users in first, second, and third place for gain muscle workouts
-    top_users = db.session.query(
-    gain_muscle_data.username,
-    func.sum(gain_muscle_data.gain_muscle)
-    .label('total_workouts')
-    ).group_by(gain_muscle_data.username
-    ).order_by(func.sum(gain_muscle_data.gain_muscle).desc()
-    ).all()
+    # today's workouts for the user, the same ones every time they open the page today
+    plan_day = eastern_today()
+    workouts = daily_plan(current_user.id, 'gain_muscle', plan_day)
+
+    # gets the top 3 users for gain muscle workouts along with the current user's rank and total workout
+    top_users, user_rank, user_total_workout = leaderboard_top('gain_muscle', current_user.id)
 
 
     # extracts the top 3 usernames and assigning them to separate variables
@@ -506,222 +1114,105 @@ def gain_muscles():
     total1 = top_users[0].total_workouts if len(top_users) >= 1 else None
     total2 = top_users[1].total_workouts if len(top_users) >= 2 else None
     total3 = top_users[2].total_workouts if len(top_users) >= 3 else None
-        
-
-    
-    user_rank = None
-    user_total_workout = None
-    # goes through the tops_users query list to get the current user rank and their total workout
-    for rank, user in enumerate(top_users, start=1):
-        # within the list, if the rank user username is the same as our current user username
-        if user.username == current_user.username:
-            # then it's our logged in user id, store their rank in the user_rank variable
-            user_rank = rank
-            # and their total workout
-            user_total_workout = user.total_workouts
-            break
 
     
-    return render_template("gain_muscles.html", username=username, workout1=random_gain_workoutset1, workout2=random_gain_workoutset2, 
-    workout3=random_gain_workoutset3, workout4=random_gain_workoutset4, 
-    workout5=random_gain_workoutset5, workout6=random_gain_workoutset6, 		
-    workout7=random_gain_workoutset7, workout8=random_gain_workoutset8, 
+    return render_template("gain_muscles.html", username=username, workout1=workouts[0], workout2=workouts[1], 
+    workout3=workouts[2], workout4=workouts[3], 
+    workout5=workouts[4], workout6=workouts[5], 		
+    workout7=workouts[6], workout8=workouts[7], plan_day=plan_day.isoformat(),
+    plan_error=old_plan_message(request.args.get('old_plan')),
 
     first_place=first_place, total1=total1, 
     second_place=second_place, total2=total2, 
     third_place=third_place, total3=total3, 
     user_rank=user_rank, user_total_workout=user_total_workout)
 
-################################## Gain Muscle rank table #################################
-@app.route('/rank')
-@login_required
-def rank():
-    # uses the same query to get the top 3 user
-    # but instead of limiting the output to 3 instead return all the users in a rank order
-    ranks  = db.session.query(
-        gain_muscle_data.username,
-        func.sum(gain_muscle_data.gain_muscle).label('total_workouts')
-    ).group_by(gain_muscle_data.username
-    ).order_by(func.sum(gain_muscle_data.gain_muscle).desc()).all()
-
-    # create an empty array to store user data so that they can be iterate through to get all users on the html page
-    user_ranks = []
-    usernames = []
-    total_workouts = []
-
-    # put every data from the query into the lists
-    for rank, user in enumerate(ranks, start=1):
-        user_ranks.append(rank)
-        usernames.append(user.username)
-        total_workouts.append(user.total_workouts)
-
-    #zipped the data so that they can be iterated through all at once on the html page
-    zipped_data = zip(user_ranks, usernames, total_workouts)
-
-
-    # store the current username 
-    current_username = current_user.username
-
-    # gets the rank of the current user so that it can be mark with red in the table
-    current_user_rank = next((i + 1 for i, username in enumerate(usernames) if username == current_username), None)
-
-    return render_template('/rank_tables/rank.html',  zipped_data=zipped_data, current_user_rank=current_user_rank)
-
-        
-
 ###################################### Lose Weight Workouts Generator #######################################
 # The code is a the same as the gain muscles but with different tables and excercise
 # list of catergorized exercsies
-lose_weight_list1 = ['Jumping Jacks', 'High Knees', 'Burpees', 'Tuck Jumps', 'Ground Zero Jump']
-lose_weight_list2 = ['Jump Squats', 'Squats', 'Boxing Squats', 'Side Step to Squat', 'Pistol Squat']
-lose_weight_list3 = ['Lunges', 'Side Lunges', 'Jumping Lunges', 'Pendulum Lunge', 'Curtsy Lunge']
-lose_weight_list4 = ['Plank', 'Plank Shoulder Tap', 'Elbow Plank', 'Knee Planks', 'Plank Tucks']
-lose_weight_list5 = ['Running in Place', 'Jogging in Place', 'Side to Side Shuffle', 'Side Toe Taps', 'Standing Cross-Crunch']
-lose_weight_list6 = ['Arm Circles', 'Arm Lateral Raises', 'Torso Twist', 'Hip Circles', 'Leg Circles']
-lose_weight_list7 = ['Russian Twists', 'Flutter Kicks', 'Bicycle Crunches', 'Ab Curl Hollow Hold', 'Oblique Twists']
-lose_weight_list8 = ['Inchworm', 'Mountain Climbers', 'Push-Ups', 'Bear Crawl', 'Cross-Body Mountain Climber']
-
-def get_lose_jumps():
-    random.shuffle(lose_weight_list1)
-    return lose_weight_list1[:1]
-
-def get_lose_squats():
-    random.shuffle(lose_weight_list2)
-    return lose_weight_list2[:1]
-
-def get_lose_lunges():
-    random.shuffle(lose_weight_list3)
-    return lose_weight_list3[:1]
-
-def get_lose_planks():
-    random.shuffle(lose_weight_list4)
-    return lose_weight_list4[:1]
-
-def get_lose_fast():
-    random.shuffle(lose_weight_list5)
-    return lose_weight_list5[:1]
-
-def get_lose_standing():
-    random.shuffle(lose_weight_list6)
-    return lose_weight_list6[:1]
-
-def get_lose_floor():
-    random.shuffle(lose_weight_list7)
-    return lose_weight_list7[:1]
-
-def get_lose_vertical():
-    random.shuffle(lose_weight_list8)
-    return lose_weight_list8[:1]
+lose_weight_exercises = (
+    ('Jumping Jacks', 'High Knees', 'Burpees', 'Tuck Jumps', 'Ground Zero Jump'),
+    ('Jump Squats', 'Squats', 'Boxing Squats', 'Side Step to Squat', 'Pistol Squat'),
+    ('Lunges', 'Side Lunges', 'Jumping Lunges', 'Pendulum Lunge', 'Curtsy Lunge'),
+    ('Plank', 'Plank Shoulder Tap', 'Elbow Plank', 'Knee Planks', 'Plank Tucks'),
+    ('Running in Place', 'Jogging in Place', 'Side to Side Shuffle', 'Side Toe Taps', 'Standing Cross-Crunch'),
+    ('Arm Circles', 'Arm Lateral Raises', 'Torso Twist', 'Hip Circles', 'Leg Circles'),
+    ('Russian Twists', 'Flutter Kicks', 'Bicycle Crunches', 'Ab Curl Hollow Hold', 'Oblique Twists'),
+    ('Inchworm', 'Mountain Climbers', 'Push-Ups', 'Bear Crawl', 'Cross-Body Mountain Climber'),
+)
+
+###################################### Daily Workout Plans #######################################
+# every user gets one plan per course per day. the plan comes from a seed made of the user, the course and the
+# eastern date, so any worker works out the same plan, the cache just saves doing it again on every page load
+app.config['DAILY_PLAN_CACHE_SIZE'] = 10000
+
+course_exercises = {'gain_muscle': gain_muscles_exercises, 'lose_weight': lose_weight_exercises}
+
+daily_plan_cache = {}
+daily_plan_lock = threading.Lock()
+
+def daily_plan(user_id, category, day=None):
+    # the exercises the user gets for a course today, e.g. ('Push-Ups', 'Wall Sits', ..., 'Curtsy Lunge')
+    key = (user_id, category, day or eastern_today())
+    with daily_plan_lock:
+        plan = daily_plan_cache.get(key)
+    if plan is not None:
+        return plan
+
+    plan = generate_exercise_plan(course_exercises[category], seed=f'{user_id}:{category}:{key[2].isoformat()}')
+    with daily_plan_lock:
+        # yesterday's plans are never asked for again, they are the oldest so they get forgotten first
+        if key not in daily_plan_cache and len(daily_plan_cache) >= app.config['DAILY_PLAN_CACHE_SIZE']:
+            daily_plan_cache.pop(next(iter(daily_plan_cache)))
+        daily_plan_cache[key] = plan
+    return plan
+
+
+def old_plan_message(old_plan):
+    # what to tell a user whose course form was for another day's plan, None when the form was fine
+    if old_plan is None:
+        return None
+    tick_again = "Here is today's plan, please tick them again."
+    try:
+        plan_day = datetime.fromisoformat(old_plan).date()
+    except ValueError:
+        # pages opened before the plans had a day on them don't send one
+        return "The plan you ticked is out of date, so your workouts weren't saved. " + tick_again
+    day = 'yesterday' if plan_day == eastern_today() - timedelta(days=1) else f'{plan_day:%A, %B} {plan_day.day}'
+    return f"Your plan was for {day}, so your workouts weren't saved. " + tick_again
 
 ###################################### Back-end for lose weight #######################################3
-class lose_weight_data(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    username = db.Column(db.String(10), nullable=False)
-    user_lastname = db.Column(db.String(10), nullable=False)
-    user_email = db.Column(db.String(10), nullable=False)
-    lose_weight = db.Column(db.Integer, nullable=True)
-    eastern_time = pytz.timezone('US/Eastern')
-    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now(tz=eastern_time))
-
-
 @app.route('/lose_weight', methods=['GET', 'POST'])
 @login_required
 def lose_weight():
     username = current_user.username
 
-    random_lose_workoutset1 = get_lose_jumps()[0]
-    random_lose_workoutset2 = get_lose_squats()[0]
-    random_lose_workoutset3 = get_lose_lunges()[0]
-    random_lose_workoutset4 = get_lose_planks()[0]
-    random_lose_workoutset5 = get_lose_fast()[0]
-    random_lose_workoutset6 = get_lose_standing()[0]
-    random_lose_workoutset7 = get_lose_floor()[0]
-    random_lose_workoutset8 = get_lose_vertical()[0]
-
-    
     if request.method == 'POST':
-        # gets the amout of workout the user did, if they don't it markes it as 0
-        workout_1 = int(request.form.get('lose_workout_1', 0))
-        workout_2 = int(request.form.get('lose_workout_2', 0))
-        workout_3 = int(request.form.get('lose_workout_3', 0))
-        workout_4 = int(request.form.get('lose_workout_4', 0))
-        workout_5 = int(request.form.get('lose_workout_5', 0))
-        workout_6 = int(request.form.get('lose_workout_6', 0))
-        workout_7 = int(request.form.get('lose_workout_7', 0))
-        workout_8 = int(request.form.get('lose_workout_8', 0))
-
-        # checks the daily_yoga_workout database to retrive the last time the current user submitted a daily_workout form
-        last_submission = lose_weight_data.query.filter_by(user_id=current_user.id).order_by(lose_weight_data.created_at.desc()).first()
-
-        # the same day time in eastern time zone
-        same_day = datetime.now(pytz.timezone('US/Eastern')).date()
-
-        # Checks if the user has already submitted a form in the current day
-        if last_submission and last_submission.created_at.date() == same_day:
-            # if so returns a sorry page
-            return redirect(url_for('workout_sorry'))
-        
-        # adds up the inputs for all the lose_weight workouts to get the total
-        lose_weight = workout_1 + workout_2 + workout_3 + workout_4 + workout_5 + workout_6 + workout_7 + workout_8
+        # saves the workouts the user did and takes them to a thank you page
+        return submit_workout('lose_weight')
 
-        # the the function input to the current user data with the number of workout they did
-        lose_weight_workout = lose_weight_data(user_id=current_user.id, username=current_user.username, 
-                    user_lastname=current_user.last_name, user_email=current_user.user_email, lose_weight=lose_weight)
-        
-        # adds that information to the database
-        db.session.add(lose_weight_workout)
-        db.session.commit()
-        
-        # returns a thank you page base on the amount of workout the user submits
-        if lose_weight == 1:       
-            return redirect(url_for('thankyou_course', total=lose_weight))
-        elif lose_weight == 2: 
-            return redirect(url_for('thankyou_course', total=lose_weight))
-        elif lose_weight == 3:
-            return redirect(url_for('thankyou_course', total=lose_weight))
-        elif lose_weight == 4:
-            return redirect(url_for('thankyou_course', total=lose_weight))
-        elif lose_weight == 5:
-            return redirect(url_for('thankyou_course', total=lose_weight))
-        elif lose_weight == 6:
-            return redirect(url_for('thankyou_course', total=lose_weight))
-        elif lose_weight == 7:
-            return redirect(url_for('thankyou_course', total=lose_weight))
-        elif lose_weight == 8:
-            return redirect(url_for('thankyou_course', total='all'))
-        else:
-            return redirect(url_for('thanks_none'))
+    plan_day = eastern_today()
+    workouts = daily_plan(current_user.id, 'lose_weight', plan_day)
         
     # query to get the usernames of users in first, second, and third place for lose weight workouts
-    lose_top_users = db.session.query(
-        lose_weight_data.username,
-        func.sum(lose_weight_data.lose_weight).label('total_workouts')
-    ).group_by(lose_weight_data.username).order_by(func.sum(lose_weight_data.lose_weight).desc()).all()
+    # gets the top 3 users for lose weight workouts along with the current user's rank and total workout
+    lose_top_users, lose_user_rank, lose_user_total_workout = leaderboard_top('lose_weight', current_user.id)
 
     # extracts usernames and assigning them to separate variables
     first_place = lose_top_users[0].username if len(lose_top_users) >= 1 else None
     second_place = lose_top_users[1].username if len(lose_top_users) >= 2 else None
     third_place = lose_top_users[2].username if len(lose_top_users) >= 3 else None
 
-    # Check for the user in the current user is in the top users list
-    lose_user_rank = None
-    lose_user_total_workout = None
-    for lose_rank, lose_user in enumerate(lose_top_users, start=1):
-        if lose_user.username == current_user.username:
-            lose_user_rank = lose_rank
-            lose_user_total_workout =  lose_user.total_workouts
-            break
-
     total1 = lose_top_users[0].total_workouts if len(lose_top_users) >= 1 else None
     total2 = lose_top_users[1].total_workouts if len(lose_top_users) >= 2 else None
     total3 = lose_top_users[2].total_workouts if len(lose_top_users) >= 3 else None
 
     return render_template(
-        "lose_weight.html", username=username, workout1=random_lose_workoutset1, workout2=random_lose_workoutset2, 
-        workout3=random_lose_workoutset3, workout4=random_lose_workoutset4, 
-        workout5=random_lose_workoutset5, workout6=random_lose_workoutset6,
-        workout7=random_lose_workoutset7, workout8=random_lose_workoutset8,
+        "lose_weight.html", username=username, workout1=workouts[0], workout2=workouts[1], 
+        workout3=workouts[2], workout4=workouts[3], 
+        workout5=workouts[4], workout6=workouts[5],
+        workout7=workouts[6], workout8=workouts[7], plan_day=plan_day.isoformat(),
+        plan_error=old_plan_message(request.args.get('old_plan')),
         
         first_place=first_place, total1=total1, 
         second_place=second_place, total2=total2, 
@@ -729,32 +1220,6 @@ def lose_weight():
 
         lose_user_rank=lose_user_rank, lose_user_total_workout=lose_user_total_workout)
 
-################################# Lose weight rank ####################################
-@app.route('/lose weight rank')
-@login_required
-def lose_weight_rank():
-    ranks  = db.session.query(
-        lose_weight_data.username,
-        func.sum(lose_weight_data.lose_weight).label('total_workouts')
-    ).group_by(lose_weight_data.username
-    ).order_by(func.sum(lose_weight_data.lose_weight).desc()).all()
-
-    user_ranks = []
-    usernames = []
-    total_workouts = []
-
-    for rank, user in enumerate(ranks, start=1):
-        user_ranks.append(rank)
-        usernames.append(user.username)
-        total_workouts.append(user.total_workouts)
-
-    zipped_data = zip(user_ranks, usernames, total_workouts)
-    current_username = current_user.username
-    current_user_rank = next((i + 1 for i, username in enumerate(usernames) if username == current_username), None)
-
-    return render_template('/rank_tables/lose_rank.html',  zipped_data=zipped_data, current_user_rank=current_user_rank)
-
-
 # Displays a thank you message once the daily workout forms have been submitted
 @app.route('/thankyou')
 @login_required
@@ -812,393 +1277,266 @@ def calculate_calories():
     
 ############################################ Youtube API ###########################################################
     
-#request for the yoga videos
-
-index = 0 
-def fetch_workout_yoga_videos():
-    global index
+# the searches for each workout page, every search is (search words, how many videos to get back)
+video_searches = {
+    'yoga': [
+        ('5 minutes yin yoga workout random', 1),
+        ('5 minute accessible yoga random', 1),
+        ('5 minutes yoga for night time random', 1),
+    ],
+    'cardio': [
+        ('5 minutes intense cardio Running', 2),
+        ('cardio in place for 5 minutes', 2),
+        ('5 minute Circuit training cardio', 2),
+    ],
+    'hiit': [
+        ('15 Min Intense HIIT Workout For Fat Burn & Cardio (No Equipment, No Repeats)', 2),
+        ('just give me something for 5 intense minute hiit', 2),
+        ('Replace Treadmill With This 10 Min HIIT/CARDIO Workout', 2),
+    ],
+}
+
+# how long saved search results are used before they are fetched again, and how long one worker
+# gets to refresh a search before another worker is allowed to try
+app.config['VIDEO_CACHE_TTL'] = timedelta(hours=24)
+app.config['VIDEO_REFRESH_TIMEOUT'] = timedelta(minutes=5)
+
+# makes the youtube client for an api key. the videos start loading as soon as the app is imported, so a fake
+# client for tests is picked before that by naming it in YOUTUBE_CLIENT_FACTORY, e.g. benchmarks.helpers:fake_youtube_client
+if os.environ.get('YOUTUBE_CLIENT_FACTORY'):
+    app.config['YOUTUBE_CLIENT_FACTORY'] = import_string(os.environ['YOUTUBE_CLIENT_FACTORY'])
+else:
+    app.config['YOUTUBE_CLIENT_FACTORY'] = lambda api_key: build('youtube', 'v3', developerKey=api_key)
+
+
+# saves the results of every youtube search in the database so all the workers share them
+# instead of each worker searching youtube again when it starts
+class video_cache(db.Model):
+    # the search words
+    search = db.Column(db.String(200), primary_key=True)
+    # the videos youtube sent back, saved as json
+    items = db.Column(db.Text, nullable=False)
+    # when the videos were fetched (utc)
+    fetched_at = db.Column(db.DateTime, nullable=False)
+    # set while a worker is refreshing this search so the other workers don't refresh it too
+    refreshing_since = db.Column(db.DateTime, nullable=True)
+
+
+# the searches run at the same time on this many threads, one per search so a refresh takes as long as the slowest one
+app.config['VIDEO_FETCH_WORKERS'] = 9
+
+# building a youtube client is slow (it loads the api description), so each thread keeps the client
+# it built for a key and reuses it, clients aren't shared between threads because they aren't thread safe
+youtube_clients = threading.local()
+
+def get_youtube_client(api_key):
+    clients = youtube_clients.__dict__.setdefault('by_key', {})
+    if api_key not in clients:
+        clients[api_key] = app.config['YOUTUBE_CLIENT_FACTORY'](api_key)
+    return clients[api_key]
+
+
+# every api key gets 10,000 quota units a day from youtube and a search costs 100 of them
+app.config['YOUTUBE_DAILY_QUOTA'] = 10000
+app.config['YOUTUBE_SEARCH_COST'] = 100
+
+
+class YouTubeKeyPool:
+    # keeps count of how much quota every api key has used today and hands out the key with the most left,
+    # the counts are kept in a small json file (with a file lock) so every thread and every worker shares them,
+    # youtube resets the quota at midnight pacific time, so the counts start again from 0 on a new pacific day
+
+    def __init__(self, api_keys, state_path):
+        self.api_keys = api_keys
+        self.state_path = state_path
+        self.thread_lock = threading.Lock()
+        self.file_lock = FileLock(state_path + '.lock')
+
+    def acquire(self, cost):
+        # picks the key with the most quota left and takes the cost off it, returns None if every key has run out
+        with self.locked_state() as state:
+            remaining = {key: self.remaining(state, key) for key in self.api_keys}
+            api_key = max(self.api_keys, key=lambda key: remaining[key])
+            if remaining[api_key] < cost:
+                return None
+            state['used'][self.key_name(api_key)] = state['used'].get(self.key_name(api_key), 0) + cost
+            return api_key
+
+    def mark_exhausted(self, api_key):
+        # youtube said the key is out of quota (e.g. it was also used somewhere else), so it isn't used again today
+        with self.locked_state() as state:
+            state['used'][self.key_name(api_key)] = app.config['YOUTUBE_DAILY_QUOTA']
+
+    def usage(self):
+        # how much of each key's quota has been used today, for checking on the keys
+        with self.locked_state() as state:
+            keys = {self.key_name(key): {'used': state['used'].get(self.key_name(key), 0),
+                                         'remaining': self.remaining(state, key)} for key in self.api_keys}
+            return {'day': state['day'], 'keys': keys,
+                    'used': sum(key['used'] for key in keys.values()),
+                    'remaining': sum(key['remaining'] for key in keys.values())}
+
+    def remaining(self, state, api_key):
+        return max(app.config['YOUTUBE_DAILY_QUOTA'] - state['used'].get(self.key_name(api_key), 0), 0)
+
+    @staticmethod
+    def key_name(api_key):
+        # only the end of the key is saved in the file
+        return api_key[-6:]
+
+    @contextmanager
+    def locked_state(self):
+        # loads the counts while holding both locks, and saves whatever was changed before letting go
+        today = datetime.now(pytz.timezone('US/Pacific')).date().isoformat()
+        with self.thread_lock, self.file_lock:
+            try:
+                with open(self.state_path) as state_file:
+                    state = json.load(state_file)
+            except (OSError, ValueError):
+                state = None
+            if state is None or state.get('day') != today:
+                state = {'day': today, 'used': {}}
+
+            yield state
+
+            with open(self.state_path, 'w') as state_file:
+                json.dump(state, state_file)
+
+
+# where the quota counts are kept, every worker using the same api keys has to use the same file.
+# tests and benchmarks point YOUTUBE_QUOTA_FILE somewhere else so they never count against the real keys
+app.config['YOUTUBE_QUOTA_FILE'] = os.environ.get('YOUTUBE_QUOTA_FILE',
+                                                  os.path.join(app.instance_path, 'youtube_quota.json'))
+os.makedirs(os.path.dirname(os.path.abspath(app.config['YOUTUBE_QUOTA_FILE'])), exist_ok=True)
+youtube_key_pool = YouTubeKeyPool(YOUTUBE_API_KEYS, app.config['YOUTUBE_QUOTA_FILE'])
+
+
+def search_youtube_videos(query, max_results):
     # try to get the video
-    while index < len(YOUTUBE_API_KEYS):
+    while True:
+        api_key = youtube_key_pool.acquire(app.config['YOUTUBE_SEARCH_COST'])
+        if api_key is None:
+            print('All key exceeded')
+            return None
+
         try:
-            youtube = build('youtube', 'v3', developerKey=YOUTUBE_API_KEYS[index])
-            request1 = youtube.search().list(
-                part='snippet',
-                q='5 minutes yin yoga workout random',
-                type='video',
-                maxResults=1,
-            )
-            response1 = request1.execute()
-            videos1 = response1['items']
-            
-        
-            request2 = youtube.search().list(
+            youtube = get_youtube_client(api_key)
+            response = youtube.search().list(
                 part='snippet',
-                q='5 minute accessible yoga random',
+                q=query,
                 type='video',
-                maxResults=1,
-            )
-            response2 = request2.execute()
-            videos2 = response2['items']
-
+                maxResults=max_results,
+            ).execute()
+            return response['items']
 
-            request3 = youtube.search().list(
-                part='snippet',
-                q='5 minutes yoga for night time random',
-                type='video',
-                maxResults=1,
-            )
-            response3 = request3.execute()
-            videos3 = response3['items']
-            return videos1, videos2, videos3
-            
         #If we exceeded quota
         except HttpError as e:
             #check if we exceed the quota
             if e.resp.status == 403 and 'quotaExceeded' in str(e):
-                # if we do it tells us 
+                # if we do it tells us, and the key isn't handed out again until the quota resets
                 print('Quota exceeded, switching ')
-                # go to the next key
-                index += 1
+                youtube_key_pool.mark_exhausted(api_key)
             #otherwise return nothing
             else:
-                # and return nothing
-                return None, None, None 
-            
-    print('All key exceeded')
-    return None, None, None 
-     #this code is the exact same for the other api builds
-
-#request for the cardio vidoes
-def fetch_workout_cardio_videos():
-    global index
-
-    while index < len(YOUTUBE_API_KEYS):
-        try:
-            youtube = build('youtube', 'v3', developerKey=YOUTUBE_API_KEYS[index])
-            request4 = youtube.search().list(
-                part='snippet',
-                q='5 minutes intense cardio Running',
-                type='video',
-                maxResults=2
-            )
-            response4 = request4.execute()
-            videos4 = response4['items']
-            
-        
-            request5 = youtube.search().list(
-                part='snippet',
-                q='cardio in place for 5 minutes',
-                type='video',
-                maxResults=2
-            )
-            response5 = request5.execute()
-            videos5 = response5['items']
+                return None
+
+
+def cached_video_search(query, max_results):
+    # gets the videos for a search from the database if they were saved, only searching youtube when they aren't
+    now = utc_now()
+    entry = db.session.get(video_cache, query)
+
+    # nothing saved yet, so this request has to wait for youtube
+    if entry is None:
+        videos = search_youtube_videos(query, max_results)
+        if videos is not None:
+            save_cached_videos(query, videos)
+        return videos
+
+    # the saved videos are too old, they are still returned straight away while one worker fetches new ones
+    if now - entry.fetched_at > app.config['VIDEO_CACHE_TTL'] and claim_video_refresh(query, now):
+        threading.Thread(target=refresh_cached_videos, args=(query, max_results), daemon=True).start()
+
+    return json.loads(entry.items)
+
+
+def claim_video_refresh(query, now):
+    # marks the search as being refreshed, only one worker can do this at a time and only while it is still old,
+    # if a worker takes too long (e.g. it crashed) another one is allowed to take over
+    claimed = db.session.execute(
+        update(video_cache)
+        .where(video_cache.search == query,
+               video_cache.fetched_at < now - app.config['VIDEO_CACHE_TTL'],
+               or_(video_cache.refreshing_since.is_(None),
+                   video_cache.refreshing_since < now - app.config['VIDEO_REFRESH_TIMEOUT']))
+        .values(refreshing_since=now)
+    ).rowcount
+    db.session.commit()
+    return claimed == 1
 
 
-            request6 = youtube.search().list(
-                part='snippet',
-                q='5 minute Circuit training cardio',
-                type='video',
-                maxResults=2 
-            )
-            response6 = request6.execute()
-            videos6 = response6['items']
-            return videos4, videos5, videos6
-        except HttpError as e:
-            if e.resp.status == 403 and 'quotaExceeded' in str(e):
-                print('Quota exceeded ')
-                index += 1
-            else:
-                return None, None, None 
-    print('All key exceeded')
-    return None, None, None
+def refresh_cached_videos(query, max_results):
+    # runs in the background so the page that found the old videos doesn't have to wait
+    with app.app_context():
+        videos = search_youtube_videos(query, max_results)
+        if videos is not None:
+            save_cached_videos(query, videos)
+        else:
+            # youtube failed, keep the old videos and let the next request try again
+            db.session.execute(update(video_cache).where(video_cache.search == query).values(refreshing_since=None))
+            db.session.commit()
 
-# request for the hiit videos
-def fetch_workout_hiit_videos():
-    global index
 
-    while index < len(YOUTUBE_API_KEYS):
-        try:
-            youtube = build('youtube', 'v3', developerKey=YOUTUBE_API_KEYS[index])
-            request7 = youtube.search().list(
-                part='snippet',
-                q='15 Min Intense HIIT Workout For Fat Burn & Cardio (No Equipment, No Repeats)',
-                type='video',
-                maxResults=2 
-            )
-            response7 = request7.execute()
-            videos7 = response7['items']
-            
-            request8 = youtube.search().list(
-                part='snippet',
-                q='just give me something for 5 intense minute hiit',
-                type='video',
-                maxResults=2 
-            )
-            response8 = request8.execute()
-            videos8 = response8['items']
+def save_cached_videos(query, videos):
+    entry = db.session.get(video_cache, query)
+    if entry is None:
+        entry = video_cache(search=query)
+        db.session.add(entry)
+    entry.items = json.dumps(videos)
+    entry.fetched_at = utc_now()
+    entry.refreshing_since = None
+    db.session.commit()
 
 
-            request9 = youtube.search().list(
-                part='snippet',
-                q='Replace Treadmill With This 10 Min HIIT/CARDIO Workout',
-                type='video',
-                maxResults=2 
-            )
-            response9 = request9.execute()
-            videos9 = response9['items']
-            return videos7, videos8, videos9
-        except HttpError as e:
-            if e.resp.status == 403 and 'quotaExceeded' in str(e):
-                print('Quota exceeded ')
-                index += 1
-            else:
-                return None, None, None
-    print('All key exceeded')
-    return None, None, None
+video_fetch_pool = ThreadPoolExecutor(max_workers=app.config['VIDEO_FETCH_WORKERS'], thread_name_prefix='video-fetch')
+
+def fetch_all_workout_videos(search=cached_video_search):
+    # runs every search of every workout page at the same time and gives back
+    # {'yoga': [videos, videos, videos], 'cardio': [...], 'hiit': [...]}
+    def run_search(query, max_results):
+        with app.app_context():
+            return search(query, max_results)
+
+    running = {
+        workout_type: [video_fetch_pool.submit(run_search, query, max_results) for query, max_results in searches]
+        for workout_type, searches in video_searches.items()
+    }
+    return {workout_type: [result.result() for result in results] for workout_type, results in running.items()}
+
+# shown in place of a video until the videos have loaded (or if youtube couldn't be reached)
+video_placeholder = [{'id': {'videoId': ''}, 'snippet': {'title': 'Videos are on their way, check back in a moment!'}}]
+
+# the workout pages show the placeholder until update_videos has run in the background
+yoga_videos = [video_placeholder] * 3
+cardio_videos = [video_placeholder] * 3
+hiit_videos = [video_placeholder] * 3
 
 def update_videos():
     global cardio_videos, yoga_videos, hiit_videos
-    yoga_videos = list(fetch_workout_yoga_videos())
-    cardio_videos = list(fetch_workout_cardio_videos())
-    hiit_videos = list(fetch_workout_hiit_videos())
+    workout_videos = fetch_all_workout_videos()
+
+    # a search that failed gets the placeholder so the page can still be shown
+    yoga_videos = [videos or video_placeholder for videos in workout_videos['yoga']]
+    cardio_videos = [videos or video_placeholder for videos in workout_videos['cardio']]
+    hiit_videos = [videos or video_placeholder for videos in workout_videos['hiit']]
 
     # randomly shuffle the videos
     random.shuffle(yoga_videos)
     random.shuffle(cardio_videos)
     random.shuffle(hiit_videos)
 
-
-
-# update the videos to a different one every 24 hours
-update_videos()
-scheduler = BackgroundScheduler()
-scheduler.add_job(update_videos, 'interval', hours=24)
-scheduler.start()
 ####################################################################################################################
 
-######################################### Back-end data for YOGA workout page ######################################
-# creates a database to store all the users workout
-class daily_yoga_workout(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    username = db.Column(db.String(10), nullable=False)
-    user_lastname = db.Column(db.String(10), nullable=False)
-    user_email = db.Column(db.String(10), nullable=False)
-    yoga = db.Column(db.Integer, nullable=True)
-    eastern_time = pytz.timezone('US/Eastern')
-    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now(tz=eastern_time))
-
-@app.route('/workout_yoga', methods=['POST'])
-@login_required
-def yoga_workout_funct():
-    if request.method == 'POST':
-        # checks the daily_yoga_workout database to retrive the last time the current user submitted a daily_workout form
-        last_submission = daily_yoga_workout.query.filter_by(user_id=current_user.id).order_by(daily_yoga_workout.created_at.desc()).first()
-
-       # the same day time in eastern time zone
-        same_day = datetime.now(pytz.timezone('US/Eastern')).date()
-
-        # Checks if the user has already submitted a form in the current day
-        if last_submission and last_submission.created_at.date() == same_day:
-            # if so returns a sorry page
-            return redirect(url_for('workout_sorry'))
-
-        # otherwise it goes on to gets the inputs from the form
-        first_yoga_vid = int(request.form.get('first_yoga_vid', 0))
-        second_yoga_vid = int(request.form.get('second_yoga_vid', 0))
-        third_yoga_vid = int(request.form.get('third_yoga_vid', 0))
-        
-        # adds up the inputs for all yoga workouts
-        yoga = first_yoga_vid + second_yoga_vid + third_yoga_vid
-
-        # the the function input to the current user data with the number of workout they did
-        yoga_workout = daily_yoga_workout(user_id=current_user.id, username=current_user.username, 
-                    user_lastname=current_user.last_name, user_email=current_user.user_email, yoga=yoga)
-        
-        # adds that information to the database
-        db.session.add(yoga_workout)
-        db.session.commit()
-        
-        # returns a thank you page base on the amount of workout the user submits
-        if yoga == 1:       
-            return redirect(url_for('thanks_workout_1', workout_type='Yoga'))
-        elif yoga == 2:
-            
-            return redirect(url_for('thanks_workout_2', workout_type='Yoga'))
-        elif yoga == 3:
-            return redirect(url_for('thanks_workout_3', workout_type='Yoga'))
-        else:
-            return redirect(url_for('thanks_none', workout_type='Yoga' ))
-        
-################################# Yoga rank ####################################
-@app.route('/yoga rank')
-@login_required
-def yoga_rank():
-    ranks  = db.session.query(
-        daily_yoga_workout.username,
-        func.sum(daily_yoga_workout.yoga).label('total_workouts')
-    ).group_by(daily_yoga_workout.username).order_by(func.sum(daily_yoga_workout.yoga).desc()).all()
-
-    user_ranks = []
-    usernames = []
-    total_workouts = []
-
-    for rank, user in enumerate(ranks, start=1):
-        user_ranks.append(rank)
-        usernames.append(user.username)
-        total_workouts.append(user.total_workouts)
-
-    zipped_data = zip(user_ranks, usernames, total_workouts)
-    current_username = current_user.username
-    current_user_rank = next((i + 1 for i, username in enumerate(usernames) if username == current_username), None)
-
-    return render_template('/rank_tables/yoga_rank.html',  zipped_data=zipped_data, current_user_rank=current_user_rank)
-
-
-###################################### Back-end data for CARDIO workout page ########################################
-
-class daily_cardio_workout(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    username = db.Column(db.String(10), nullable=False)
-    user_lastname = db.Column(db.String(10), nullable=False)
-    user_email = db.Column(db.String(10), nullable=False)
-    cardio = db.Column(db.Integer, nullable=True)
-    eastern_time = pytz.timezone('US/Eastern')
-    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now(tz=eastern_time))
-
-        
-#### The function and method use for the cardio and hiit are the same as the yoga
-@app.route('/workout_cardio', methods=['POST'])
-@login_required
-def cardio_workout_funct():
-    if request.method == 'POST':
-        last_submission = daily_cardio_workout.query.filter_by(user_id=current_user.id).order_by(daily_cardio_workout.created_at.desc()).first()
-
-        same_day = datetime.now(pytz.timezone('US/Eastern')).date()
-
-        if last_submission and last_submission.created_at.date() == same_day:
-            return redirect(url_for('workout_sorry'))
-
-        first_cardio_vid = int(request.form.get('first_cardio_vid', 0))
-        second_cardio_vid = int(request.form.get('second_cardio_vid', 0))
-        third_cardio_vid = int(request.form.get('third_cardio_vid', 0))
-        
-        cardio = first_cardio_vid + second_cardio_vid + third_cardio_vid
-
-        cardio_workout = daily_cardio_workout(user_id=current_user.id, username=current_user.username, 
-                    user_lastname=current_user.last_name, user_email=current_user.user_email, cardio=cardio)
-        
-        db.session.add(cardio_workout)
-        db.session.commit()
-
-        if cardio == 1:
-            return redirect(url_for('thanks_workout_1', workout_type='Cardio'))
-        elif cardio == 2:
-            return redirect(url_for('thanks_workout_2', workout_type='Cardio'))
-        elif cardio == 3:
-            return redirect(url_for('thanks_workout_3', workout_type='Cardio'))
-        else:
-            return redirect(url_for('thanks_none', workout_type='Cardio'))
-        
-
-################################# Cardio rank ####################################
-@app.route('/cardio rank')
-@login_required
-def cardio_rank():
-    ranks  = db.session.query(
-        daily_cardio_workout.username,
-        func.sum(daily_cardio_workout.cardio).label('total_workouts')
-    ).group_by(daily_cardio_workout.username).order_by(func.sum(daily_cardio_workout.cardio).desc()).all()
-
-    user_ranks = []
-    usernames = []
-    total_workouts = []
-
-    for rank, user in enumerate(ranks, start=1):
-        user_ranks.append(rank)
-        usernames.append(user.username)
-        total_workouts.append(user.total_workouts)
-
-    zipped_data = zip(user_ranks, usernames, total_workouts)
-    current_username = current_user.username
-    current_user_rank = next((i + 1 for i, username in enumerate(usernames) if username == current_username), None)
-
-    return render_template('/rank_tables/cardio_rank.html',  zipped_data=zipped_data, current_user_rank=current_user_rank)
-   
-        
-###################################### Back-end data for HIIT workout page ###########################################
-class daily_hiit_workout(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    username = db.Column(db.String(10), nullable=False)
-    user_lastname = db.Column(db.String(10), nullable=False)
-    user_email = db.Column(db.String(10), nullable=False)
-    hiit = db.Column(db.Integer, nullable=True)
-    eastern_time = pytz.timezone('US/Eastern')
-    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now(tz=eastern_time))
-
-@app.route('/workout_hiit', methods=['POST'])
-@login_required
-def hiit_workout_funct():
-    if request.method == 'POST':
-        eastern = pytz.timezone('US/Eastern')
-        last_submission = daily_hiit_workout.query.filter_by(user_id=current_user.id).order_by(daily_hiit_workout.created_at.desc()).first()
-
-        same_day = datetime.now(pytz.timezone('US/Eastern')).date()
-
-        if last_submission and last_submission.created_at.date() == same_day:         
-            return redirect(url_for('workout_sorry'))
-
-
-        first_hiit_vid = int(request.form.get('first_hiit_vid', 0))
-        second_hiit_vid = int(request.form.get('second_hiit_vid', 0))
-        third_hiit_vid = int(request.form.get('third_hiit_vid', 0))
-        
-        hiit = first_hiit_vid + second_hiit_vid + third_hiit_vid
-
-        hiit_workout = daily_hiit_workout(user_id=current_user.id, username=current_user.username, 
-                                          user_lastname=current_user.last_name, user_email=current_user.user_email, hiit=hiit)
-        
-        db.session.add(hiit_workout)
-        db.session.commit()
-        
-        if hiit == 1:
-            return redirect(url_for('thanks_workout_1', workout_type='Hiit'))
-        elif hiit == 2:
-            return redirect(url_for('thanks_workout_2', workout_type='Hiit'))
-        elif hiit == 3:
-            return redirect(url_for('thanks_workout_3', workout_type='Hiit'))
-        else:
-            return redirect(url_for('thanks_none', workout_type='Hiit'))
-###########################################################################################################
-################################# Hiit rank ###############################################################
-@app.route('/hiit rank')
-@login_required
-def hiit_rank():
-    ranks  = db.session.query(
-        daily_hiit_workout.username,
-        func.sum(daily_hiit_workout.hiit).label('total_workouts')
-    ).group_by(daily_hiit_workout.username).order_by(func.sum(daily_hiit_workout.hiit).desc()).all()
-
-    user_ranks = []
-    usernames = []
-    total_workouts = []
-
-    for rank, user in enumerate(ranks, start=1):
-        user_ranks.append(rank)
-        usernames.append(user.username)
-        total_workouts.append(user.total_workouts)
-
-    zipped_data = zip(user_ranks, usernames, total_workouts)
-    current_username = current_user.username
-    current_user_rank = next((i + 1 for i, username in enumerate(usernames) if username == current_username), None)
-
-    return render_template('/rank_tables/hiit_rank.html',  zipped_data=zipped_data, current_user_rank=current_user_rank)
-##################################################################################################################
-
-
 # Displays a thank you message once the daily workout forms have been submitted
 @app.route('/thanks_workout_1')
 def thanks_workout_1():
@@ -1238,27 +1576,18 @@ def workout_sorry():
 class Report(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    username = db.Column(db.String(10), nullable=False)  # Remove unique=True
-    user_lastname = db.Column(db.String(10), nullable=False)
-    user_email = db.Column(db.String(10), nullable=False)
-    problem = db.Column(db.Integer, nullable=True)
+    # the problem picked on the form, e.g. 'security', sqlite let it be saved in an integer column but postgres won't
+    problem = db.Column(db.Text, nullable=True)
     extra = db.Column(db.Text, nullable=False)
-    eastern_time = pytz.timezone('US/Eastern')
-    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now(tz=eastern_time))
+    created_at = db.Column(db.DateTime, nullable=False, default=utc_now)
+    local_date = db.Column(db.Date, nullable=False, default=eastern_today)
+    __table_args__ = (db.Index('ix_report_user_day', 'user_id', 'local_date'),)
 
 @app.route('/report', methods=['POST'])
 @login_required
 def submit_report():
-    eastern = pytz.timezone('US/Eastern')
-    current_date = datetime.now(eastern).date()
-
     # Get the user's submission count for today
-    submission_count = (
-        Report.query
-        .filter_by(user_id=current_user.id)
-        .filter(Report.created_at >= current_date)
-        .count()
-    )
+    submission_count = Report.query.filter_by(user_id=current_user.id, local_date=eastern_today()).count()
     # check if the user had submitted more than 2 report forms per day
     if submission_count >= 2:         
         return redirect(url_for('limit_footer', form_type='Report'))
@@ -1274,11 +1603,11 @@ def submit_report():
     # get the extra request from the form
     extra = request.form['extra']
     # put those input into the function
-    report = Report(user_id=current_user.id, username=current_user.username, 
-                    user_lastname=current_user.last_name, user_email=current_user.user_email, problem=problem, extra=extra)
+    report = Report(user_id=current_user.id, problem=problem, extra=extra)
     # add those to the database
     db.session.add(report)
     db.session.commit()
+    forget_user_stats(current_user.id)
     # and redirects the user to a thank you page
     return redirect(url_for('thanks_report'))
 
@@ -1291,39 +1620,331 @@ def thanks_report():
 
 ################################################ Review database #################################################
 
+# a review is shown to everyone when it is public and has some writing in it, this is written out as plain sql
+# (not a bound parameter) because the database can only use the public feed index when the query repeats it exactly
+public_review_condition = "status = 'public' AND extra != ''"
+
 # The function and structure method for review is the same as the report page
 class Review(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    username = db.Column(db.String(10), nullable=False)
-    user_lastname = db.Column(db.String(10), nullable=False)
-    user_email = db.Column(db.String(10), nullable=False)
     rating = db.Column(db.Integer, nullable=True)
     extra = db.Column(db.Text, nullable=True)
     status = db.Column(db.Text, nullable=True)
-    eastern_time = pytz.timezone('US/Eastern')
-    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now(tz=eastern_time))
+    created_at = db.Column(db.DateTime, nullable=False, default=utc_now)
+    local_date = db.Column(db.Date, nullable=False, default=eastern_today)
+    __table_args__ = (
+        db.Index('ix_review_user_created', 'user_id', 'created_at'),
+        # one review per user per day
+        db.Index('uq_review_user_day', 'user_id', 'local_date', unique=True),
+        # only indexes the reviews everyone can see, newest first, so the public feed reads straight off it. the
+        # condition is only given for the database in use, naming postgresql here loads its dialect on every start
+        db.Index('ix_review_public_feed', created_at.desc(), id.desc(),
+                 **({f'{database_backend}_where': text(public_review_condition)}
+                    if database_backend in ('sqlite', 'postgresql') else {})),
+    )
+
+    # the user who posted the review, loaded in the same query so the review page can show their username
+    user = db.relationship('User', lazy='joined')
 
     # allows call on specific elements such as the rating, id of a particular comment
     def __repr__(self):
-        return f"<Review id={self.id}, username={self.username}, rating={self.rating}, created_at={self.created_at}>"
+        return f"<Review id={self.id}, user_id={self.user_id}, rating={self.rating}, created_at={self.created_at}>"
+
+
+# the tables that used to copy the user's details into every row
+copied_user_columns_tables = ['gain_muscle_data', 'lose_weight_data', 'daily_yoga_workout', 'daily_cardio_workout',
+                              'daily_hiit_workout', 'review', 'report']
+
+# every category used to have its own table, these are the old tables and the column that held the amount
+old_workout_tables = {
+    'gain_muscle_data': ('gain_muscle', 'gain_muscle'),
+    'lose_weight_data': ('lose_weight', 'lose_weight'),
+    'daily_yoga_workout': ('yoga', 'yoga'),
+    'daily_cardio_workout': ('cardio', 'cardio'),
+    'daily_hiit_workout': ('hiit', 'hiit'),
+}
+
+# tables with a once a day limit, they save the eastern date of each row in local_date
+daily_limit_tables = ['workout', 'review', 'report']
+
+# indexes that newer ones replaced
+replaced_indexes = ['ix_workout_user_category_created', 'ix_report_user_created', 'ix_workout_user_category_day',
+                    'ix_review_user_day']
+
+# the one-off steps of upgrade_database that can't be told from the tables, each gets a row here in the same
+# transaction as its changes, so a worker that crashed halfway or starts later never runs one twice
+class upgrade_step(db.Model):
+    name = db.Column(db.String(80), primary_key=True)
+    done_at = db.Column(db.DateTime, nullable=False, default=utc_now)
+
+
+def upgrade_step_done(connection, name):
+    return connection.execute(select(upgrade_step.name).where(upgrade_step.name == name)).first() is not None
+
+
+@contextmanager
+def run_upgrade_step(name):
+    # gives the connection to do the step with (or None when it was already done) and records it in the same commit
+    with db.engine.begin() as connection:
+        if upgrade_step_done(connection, name):
+            yield None
+            return
+        yield connection
+        connection.execute(insert(upgrade_step).values(name=name))
+
+
+def legacy_times_to_utc(connection, table, columns, zone=None, after_id=0):
+    # older versions saved times as eastern wall clock (or the server's own clock when zone is None), this turns
+    # them into the plain UTC times utc_now saves. after_id leaves the rows up to that id alone
+    old_table = sql_table(table, sql_column('id'), *[sql_column(column, db.DateTime) for column in columns])
+    changes = []
+    for row in connection.execute(select(old_table).where(old_table.c.id > after_id)).mappings():
+        change = {'row_id': row['id']}
+        for column in columns:
+            saved = row[column]
+            if saved is not None:
+                saved = (zone.localize(saved) if zone else saved.astimezone()).astimezone(pytz.utc).replace(tzinfo=None)
+            change[f'new_{column}'] = saved
+        changes.append(change)
+    if changes:
+        connection.execute(
+            update(old_table).where(old_table.c.id == bindparam('row_id'))
+            .values({column: bindparam(f'new_{column}') for column in columns}),
+            changes
+        )
+
+
+# brings a database made by an older version of the app up to date without losing any data,
+# create_all only makes tables that don't exist yet, so anything added to an existing table is done here
+def upgrade_database():
+    eastern = pytz.timezone('US/Eastern')
+    inspector = inspect(db.engine)
+    existing_tables = inspector.get_table_names()
+
+    # a database from before the times were saved in UTC still has the old per category tables or a once a day
+    # table without local_date (both went in with the UTC times). that is written down first, because the steps
+    # below take both away, and the times are only turned into UTC while it is written down
+    if any(table in existing_tables for table in old_workout_tables) or any(
+            table in existing_tables and 'local_date' not in [column['name'] for column in inspector.get_columns(table)]
+            for table in daily_limit_tables):
+        with run_upgrade_step('found_eastern_times'):
+            pass
+    with db.engine.connect() as connection:
+        eastern_times = upgrade_step_done(connection, 'found_eastern_times')
+
+    # created_at was saved in eastern time, last_login in the server's own time
+    if eastern_times:
+        with run_upgrade_step('utc_times_user') as connection:
+            if connection is not None:
+                legacy_times_to_utc(connection, User.__table__.name, ['created_at'], eastern)
+                legacy_times_to_utc(connection, User.__table__.name, ['last_login'])
+
+    # the workout, review and report tables used to keep a copy of the user's username, last name and email,
+    # they now only keep user_id and the rest is read from the user table, so the old copies are removed
+    for table in copied_user_columns_tables:
+        if table not in existing_tables:
+            continue
+        existing_columns = [column['name'] for column in inspector.get_columns(table)]
+        old_columns = [column for column in ('username', 'user_lastname', 'user_email') if column in existing_columns]
+        if not old_columns:
+            continue
+
+        with db.engine.begin() as connection:
+            # rows whose user_id doesn't point at a user are matched back to their user by the old username copy
+            if 'username' in old_columns:
+                old_table = sql_table(table, sql_column('user_id'), sql_column('username'))
+                connection.execute(
+                    update(old_table)
+                    .where(old_table.c.user_id.not_in(select(User.id)), old_table.c.username.in_(select(User.username)))
+                    .values(user_id=select(User.id).where(User.username == old_table.c.username).scalar_subquery())
+                )
+            quote = connection.dialect.identifier_preparer.quote
+            for column in old_columns:
+                connection.execute(text(f'ALTER TABLE {quote(table)} DROP COLUMN {quote(column)}'))
+
+    # rows saved before there was a local_date column get the date part of their created_at, those times were
+    # saved in eastern time so it is already the eastern date. then their times are turned into UTC
+    for table in daily_limit_tables:
+        if table not in existing_tables or 'local_date' in [column['name'] for column in inspector.get_columns(table)]:
+            continue
+        with db.engine.begin() as connection:
+            quote = connection.dialect.identifier_preparer.quote
+            date_type = db.Date().compile(dialect=connection.dialect)
+            connection.execute(text(f'ALTER TABLE {quote(table)} ADD COLUMN local_date {date_type}'))
+    for table in daily_limit_tables:
+        if table not in existing_tables or not eastern_times:
+            continue
+        with run_upgrade_step(f'utc_times_{table}') as connection:
+            if connection is not None:
+                old_table = sql_table(table, sql_column('created_at'), sql_column('local_date'))
+                connection.execute(
+                    update(old_table).where(old_table.c.local_date.is_(None))
+                    .values(local_date=func.date(old_table.c.created_at))
+                )
+                legacy_times_to_utc(connection, table, ['created_at'], eastern)
+
+    # the workouts from the old per category tables are moved into the workout table, then the old tables are removed
+    for table, (category, amount_column) in old_workout_tables.items():
+        if table not in existing_tables:
+            continue
+        old_table = sql_table(table, sql_column('user_id'), sql_column(amount_column), sql_column('created_at'))
+        with db.engine.begin() as connection:
+            last_id = connection.execute(select(func.max(workout.id))).scalar() or 0
+            connection.execute(
+                # more than one workout on the same day becomes a single one with the amounts added up
+                insert(workout).from_select(
+                    ['user_id', 'category', 'amount', 'created_at', 'local_date'],
+                    select(old_table.c.user_id, literal(category), func.sum(old_table.c[amount_column]),
+                           func.min(old_table.c.created_at), func.date(old_table.c.created_at))
+                    .group_by(old_table.c.user_id, func.date(old_table.c.created_at))
+                    .order_by(func.min(old_table.c.created_at))
+                )
+            )
+            # the eastern times were only needed for the dates, the moved rows get UTC times like new ones
+            legacy_times_to_utc(connection, workout.__table__.name, ['created_at'], eastern, after_id=last_id)
+            connection.execute(text(f'DROP TABLE {connection.dialect.identifier_preparer.quote(table)}'))
+
+    # the once a day limits are unique indexes now. a database that still has two workouts in the same category on
+    # the same day gets them merged into one with the amounts added up, so the leaderboard totals stay the same.
+    # once an index is there it keeps duplicates out, so the scans below only run until it has been made
+    inspector = inspect(db.engine)
+    workout_indexes = [table_index['name'] for table_index in inspector.get_indexes('workout')]
+    review_indexes = [table_index['name'] for table_index in inspector.get_indexes('review')]
+    with db.engine.begin() as connection:
+        if 'uq_workout_user_category_day' not in workout_indexes:
+            duplicates = (
+                select(workout.user_id, workout.category, workout.local_date, func.min(workout.id).label('keep_id'),
+                       func.sum(workout.amount).label('amount'))
+                .group_by(workout.user_id, workout.category, workout.local_date)
+                .having(func.count() > 1)
+            ).subquery()
+            for duplicate in connection.execute(select(duplicates)).all():
+                same_day_rows = and_(workout.user_id == duplicate.user_id, workout.category == duplicate.category,
+                                     workout.local_date == duplicate.local_date)
+                connection.execute(update(workout).where(workout.id == duplicate.keep_id).values(amount=duplicate.amount))
+                connection.execute(workout.__table__.delete().where(same_day_rows, workout.id != duplicate.keep_id))
+
+        # reviews can't be merged, so a user's later reviews on a day they already reviewed are moved onto the days
+        # before their first review, then the index can be made and the limit holds for everyone. the old app
+        # stamped every review from one run with the same time, so those dates were never real anyway, and the
+        # review page is ordered by created_at so nothing moves there
+        if 'uq_review_user_day' not in review_indexes:
+            users_with_duplicates = (
+                select(Review.user_id).group_by(Review.user_id, Review.local_date).having(func.count() > 1)
+            )
+            user_reviews = {}
+            for review in connection.execute(
+                    select(Review.id, Review.user_id, Review.local_date)
+                    .where(Review.user_id.in_(users_with_duplicates)).order_by(Review.id)).all():
+                user_reviews.setdefault(review.user_id, []).append(review)
+            moves = []
+            for reviews in user_reviews.values():
+                free_day = min(review.local_date for review in reviews)
+                reviewed_days = set()
+                for review in reviews:
+                    if review.local_date in reviewed_days:
+                        free_day -= timedelta(days=1)
+                        moves.append({'review_key': review.id, 'new_date': free_day})
+                    reviewed_days.add(review.local_date)
+            if moves:
+                reviews_table = Review.__table__
+                connection.execute(
+                    update(reviews_table).where(reviews_table.c.id == bindparam('review_key'))
+                    .values(local_date=bindparam('new_date')),
+                    moves
+                )
+                print(f'Moved {len(moves)} reviews of {len(user_reviews)} users off days they had already reviewed')
+
+        for index_name in replaced_indexes:
+            connection.execute(text(f'DROP INDEX IF EXISTS {connection.dialect.identifier_preparer.quote(index_name)}'))
+
+    # adds any index that is missing (e.g. the user_id/local_date indexes on the workout, review and report tables)
+    for table in db.metadata.sorted_tables:
+        for table_index in table.indexes:
+            table_index.create(bind=db.engine, checkfirst=True)
+
+
+def fill_leaderboard_totals():
+    # starts from an empty table so running it twice doesn't double the totals
+    leaderboard_total.query.delete()
+
+    # adds up the workouts per category and user inside the database and copies the sums straight across
+    db.session.execute(
+        insert(leaderboard_total).from_select(
+            ['category', 'user_id', 'total'],
+            select(workout.category, workout.user_id, func.coalesce(func.sum(workout.amount), 0))
+            .where(workout.category.in_(workout_categories))
+            .group_by(workout.category, workout.user_id)
+        )
+    )
+    db.session.commit()
 
 
+# workers starting at the same time take turns, so only the first one upgrades the database and the others find
+# it done. tests and benchmarks point UPGRADE_LOCK_FILE next to their own throwaway database
+app.config['UPGRADE_LOCK_FILE'] = os.environ.get('UPGRADE_LOCK_FILE',
+                                                 os.path.join(app.instance_path, 'upgrade_database.lock'))
+os.makedirs(os.path.dirname(os.path.abspath(app.config['UPGRADE_LOCK_FILE'])), exist_ok=True)
+
 # Create tables all the databases for the application when the application is run
-with app.app_context():
+with app.app_context(), FileLock(app.config['UPGRADE_LOCK_FILE']):
     db.create_all()
+    upgrade_database()
+    # a database from before the leaderboard totals (or one the upgrade just moved the workouts into) has workouts
+    # but no totals, so every leaderboard and summary would show 0 until they are added up
+    if db.session.query(workout.id).first() is not None and db.session.query(leaderboard_total.user_id).first() is None:
+        try:
+            fill_leaderboard_totals()
+        except IntegrityError:
+            # another worker starting at the same time added them up first
+            db.session.rollback()
 
-@app.route('/review', methods=['POST'])
-@login_required 
-def submit_review():
-    last_submission = Review.query.filter_by(user_id=current_user.id).order_by(Review.created_at.desc()).first()
-    same_day = datetime.now(pytz.timezone('US/Eastern')).date()
 
+# loads the videos (from the saved searches when there are some) and reloads them every hour,
+# searches older than VIDEO_CACHE_TTL get refreshed in the background when they are read
+# the first load runs straight away on the scheduler's thread so starting the app never waits for youtube
+scheduler = BackgroundScheduler()
+scheduler.add_job(update_videos, 'interval', hours=1, next_run_time=datetime.now())
+scheduler.add_job(flush_logins, 'interval', seconds=app.config['LOGIN_FLUSH_SECONDS'])
+scheduler.start()
 
-    # allows 3 review submission per day
-    if last_submission and last_submission.created_at.date() == same_day:       
-        return redirect(url_for('limit_footer', form_type='Review'))
 
+# shows how much of today's youtube quota each api key has used: flask --app app youtube-quota
+@app.cli.command('youtube-quota')
+def youtube_quota():
+    usage = youtube_key_pool.usage()
+    print(f"Quota day {usage['day']} (Pacific time): {usage['used']} used, {usage['remaining']} remaining")
+    for key_name, key_usage in usage['keys'].items():
+        print(f"  key ...{key_name}: {key_usage['used']} used, {key_usage['remaining']} remaining")
+
+
+# fetches every workout search from youtube and saves it, so the app starts with the videos ready
+# run it before starting the app (or from a cron job) with: flask --app app prefetch-videos
+@app.cli.command('prefetch-videos')
+def prefetch_videos():
+    workout_videos = fetch_all_workout_videos(search=search_youtube_videos)
+    for workout_type, searches in video_searches.items():
+        for (query, max_results), videos in zip(searches, workout_videos[workout_type]):
+            if videos is None:
+                print(f'{workout_type}: could not fetch "{query}"')
+            else:
+                save_cached_videos(query, videos)
+                print(f'{workout_type}: saved {len(videos)} videos for "{query}"')
+
+# one-shot command to fill the leaderboard totals from the workouts already in the database, the app does this
+# itself when it starts with workouts but no totals, run it by hand with: flask --app app backfill-leaderboard
+@app.cli.command('backfill-leaderboard')
+def backfill_leaderboard():
+    fill_leaderboard_totals()
+
+    for category in workout_categories:
+        count = leaderboard_total.query.filter_by(category=category).count()
+        print(f'{category}: {count} users')
+
+@app.route('/review', methods=['POST'])
+@login_required 
+def submit_review():
     # if user give a rating, get it
     if 'rating' in request.form:
         rating = int(request.form['rating'])
@@ -1336,10 +1957,16 @@ def submit_review():
 
     status = request.form['status']
 
-    review = Review(user_id=current_user.id, username=current_user.username, 
-                    user_lastname=current_user.last_name, user_email=current_user.user_email, rating=rating, extra=extra, status=status)
+    review = Review(user_id=current_user.id, rating=rating, extra=extra, status=status)
     db.session.add(review)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # allows 1 review submission per day, the unique index on (user_id, local_date) turns away the second one
+        db.session.rollback()
+        return redirect(url_for('limit_footer', form_type='Review'))
+    clear_review_feed_cache()
+    forget_user_stats(current_user.id)
     return redirect(url_for('thanks_review'))
 
 ###################### Edit comments #########################
@@ -1365,6 +1992,7 @@ def edit_comment(comment_id):
             comment.extra = request.form['edited_comment']
             comment.status = request.form['edited_status']
             db.session.commit()
+            clear_review_feed_cache()
             return redirect(url_for('review'))
         else:
             # Render the edit comment form when the user hits edit
@@ -1389,10 +2017,79 @@ def delete_comment(comment_id):
         # Delete the comment
         db.session.delete(comment)
         db.session.commit()
+        clear_review_feed_cache()
+        forget_user_stats(current_user.id)
     # Redirect them back to the page
     return redirect(url_for('review'))
 ###############################################################
 
+###################### Review feed ###########################
+# the public reviews are shown a page at a time, and each rendered page is kept for a short while since
+# it looks the same for everyone, only the current user's own reviews are looked up on every visit
+app.config['REVIEW_PAGE_SIZE'] = 20
+# other workers don't know when a review changes, so a rendered page is only kept this long
+app.config['REVIEW_FEED_CACHE_SECONDS'] = 60
+app.config['REVIEW_FEED_CACHE_PAGES'] = 50
+
+review_feed_cache = {}
+review_feed_lock = threading.Lock()
+
+def clear_review_feed_cache():
+    # called whenever a review is added, edited or deleted
+    with review_feed_lock:
+        review_feed_cache.clear()
+
+
+def public_review_page(after=None):
+    # gets one page of the public reviews, newest first, starting after the (created_at, id) of the last review shown
+    query = Review.query.filter(text(public_review_condition))
+    if after is not None:
+        created_at, review_id = after
+        query = query.filter(or_(Review.created_at < created_at,
+                                 and_(Review.created_at == created_at, Review.id < review_id)))
+
+    page_size = app.config['REVIEW_PAGE_SIZE']
+    # reads one extra review to know if there is another page
+    reviews = query.order_by(Review.created_at.desc(), Review.id.desc()).limit(page_size + 1).all()
+
+    next_cursor = None
+    if len(reviews) > page_size:
+        reviews = reviews[:page_size]
+        next_cursor = f'{reviews[-1].created_at.isoformat()},{reviews[-1].id}'
+    return reviews, next_cursor
+
+
+def parse_review_cursor(cursor):
+    # turns a "created_at,id" bookmark from the url back into a date and id, a broken one means the first page
+    try:
+        created_at, review_id = cursor.rsplit(',', 1)
+        return datetime.fromisoformat(created_at), int(review_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def rendered_public_reviews(cursor):
+    # the public reviews page as html, rendered once and then reused until a review changes or it gets too old
+    after = parse_review_cursor(cursor)
+    cache_key = cursor if after is not None else None
+    now = time.monotonic()
+
+    with review_feed_lock:
+        cached = review_feed_cache.get(cache_key)
+    if cached is not None and now - cached[1] < app.config['REVIEW_FEED_CACHE_SECONDS']:
+        return cached[0]
+
+    reviews, next_cursor = public_review_page(after)
+    html = render_template('/footer/review_feed.html', comment=reviews, next_cursor=next_cursor)
+
+    with review_feed_lock:
+        # keeps the memory used small by forgetting the oldest page once there are too many
+        if cache_key not in review_feed_cache and len(review_feed_cache) >= app.config['REVIEW_FEED_CACHE_PAGES']:
+            review_feed_cache.pop(next(iter(review_feed_cache)))
+        review_feed_cache[cache_key] = (html, now)
+    return html
+###############################################################
+
 # creates a route for the review thank you page
 @app.route('/thanks_review')
 @login_required
@@ -1411,37 +2108,102 @@ def limit_footer():
 ####################################################################################################################
 
 ############################################### Summary Page #######################################################
+# the summary numbers for a user are kept for a short while and forgotten as soon as they
+# submit a workout, review or report, other workers only find out when their copy gets too old
+app.config['USER_STATS_CACHE_SECONDS'] = 60
+app.config['USER_STATS_CACHE_SIZE'] = 10000
+
+user_stats_cache = {}
+user_stats_lock = threading.Lock()
+
+def user_stats(user_id):
+    # the user's total workouts in every category and how many reviews and reports they sent, e.g.
+    # {'gain_muscle': 12, 'lose_weight': 0, 'yoga': 3, 'cardio': 0, 'hiit': 5, 'review': 1, 'report': 0}
+    now = time.monotonic()
+    with user_stats_lock:
+        cached = user_stats_cache.get(user_id)
+    if cached is not None and now - cached[1] < app.config['USER_STATS_CACHE_SECONDS']:
+        return cached[0]
+
+    # everything comes back from one query: the running workout totals plus the review and report counts,
+    # each part is read off an index on user_id
+    rows = db.session.execute(union_all(
+        select(leaderboard_total.category, leaderboard_total.total).where(leaderboard_total.user_id == user_id),
+        select(literal('review'), func.count()).select_from(Review).where(Review.user_id == user_id),
+        select(literal('report'), func.count()).select_from(Report).where(Report.user_id == user_id),
+    )).all()
+
+    # a category the user hasn't done yet counts as 0
+    stats = dict.fromkeys(list(workout_categories) + ['review', 'report'], 0)
+    stats.update({name: count or 0 for name, count in rows})
+
+    with user_stats_lock:
+        # keeps the memory used small by forgetting the oldest user once there are too many
+        if user_id not in user_stats_cache and len(user_stats_cache) >= app.config['USER_STATS_CACHE_SIZE']:
+            user_stats_cache.pop(next(iter(user_stats_cache)))
+        user_stats_cache[user_id] = (stats, now)
+    return stats
+
+
+def forget_user_stats(user_id):
+    # called whenever the user submits a workout, review or report (or deletes a review)
+    with user_stats_lock:
+        user_stats_cache.pop(user_id, None)
+
 @app.route('/summary', methods=['GET', 'POST'])
 @login_required
 def summary():
     username = current_user.username
-    
-    gm_total_workouts = db.session.query(func.sum(gain_muscle_data.gain_muscle)).filter_by(username=username).scalar()
-    lw_total_workouts = db.session.query(func.sum(lose_weight_data.lose_weight)).filter_by(username=username).scalar()
-    yoga_total_workouts = db.session.query(func.sum(daily_yoga_workout.yoga)).filter_by(username=username).scalar()
-    cardio_total_workouts = db.session.query(func.sum(daily_cardio_workout.cardio)).filter_by(username=username).scalar()
-    hiit_total_workouts = db.session.query(func.sum(daily_hiit_workout.hiit)).filter_by(username=username).scalar()
-    total_review = (Review.query.filter_by(user_id=current_user.id).count())
-    total_report = (Report.query.filter_by(user_id=current_user.id).count())
-    
+    stats = user_stats(current_user.id)
 
+    login_count = current_user.login_count
+    return render_template('summary.html', username=username, gm_total_workouts=stats['gain_muscle'], lw_total_workouts=stats['lose_weight'], 
+                           yoga_total_workouts=stats['yoga'], cardio_total_workouts=stats['cardio'], 
+                           hiit_total_workouts=stats['hiit'], login_count=login_count, total_review=stats['review'], total_report=stats['report'])
 
-    # if the user has done a specific workout yet
-    if gm_total_workouts is None:
-        gm_total_workouts = 0
-    if lw_total_workouts is None:
-        lw_total_workouts = 0
-    if yoga_total_workouts is None:
-       yoga_total_workouts = 0
-    if cardio_total_workouts is None:
-       cardio_total_workouts = 0
-    if hiit_total_workouts is None:
-       hiit_total_workouts = 0
 
-    login_count = current_user.login_count
-    return render_template('summary.html', username=username, gm_total_workouts=gm_total_workouts, lw_total_workouts=lw_total_workouts, 
-                           yoga_total_workouts=yoga_total_workouts, cardio_total_workouts=cardio_total_workouts, 
-                           hiit_total_workouts=hiit_total_workouts, login_count=login_count, total_review=total_review, total_report=total_report)
+
+############################################### Rendered pages #####################################################
+# pages like about us or the report form look the same every time, or only change with the username, so they
+# are rendered once and kept. a page is kept under its route, the username and the time its template was last
+# changed, so editing a template shows up straight away. the browser gets an ETag and when it asks again with
+# If-None-Match it just gets a 304 back
+app.config['PAGE_CACHE_SIZE'] = 1000
+
+page_cache = {}
+page_cache_lock = threading.Lock()
+
+
+def template_mtime(template):
+    path = os.path.join(app.root_path, app.template_folder, *template.strip('/').split('/'))
+    return os.stat(path).st_mtime_ns
+
+
+def render_cached_page(template, username=None, **context):
+    # the rest of the context must be the same on every visit, only the username can change the page
+    cache_key = (request.endpoint, username, template_mtime(template))
+    with page_cache_lock:
+        cached = page_cache.pop(cache_key, None)
+        if cached is not None:
+            # put back at the end, so the pages that haven't been asked for the longest are the first forgotten
+            page_cache[cache_key] = cached
+
+    if cached is None:
+        if username is not None:
+            context['username'] = username
+        body = render_template(template, **context).encode()
+        cached = (body, hashlib.sha1(body).hexdigest())
+        with page_cache_lock:
+            if cache_key not in page_cache and len(page_cache) >= app.config['PAGE_CACHE_SIZE']:
+                page_cache.pop(next(iter(page_cache)))
+            page_cache[cache_key] = cached
+
+    body, etag = cached
+    response = app.response_class(body, mimetype='text/html')
+    response.set_etag(etag)
+    # only this user's browser may keep it, and it has to check the ETag before showing it again
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
 
 
 
@@ -1449,19 +2211,19 @@ def summary():
 
 @app.route("/forgot")
 def forgot():
-    return render_template("/login/forgot.html")
+    return render_cached_page("/login/forgot.html")
 
 @app.route("/Home")
 @login_required
 def home():
     username = current_user.username
-    return render_template("home.html", username=username)
+    return render_cached_page("home.html", username=username)
 
 @app.route('/nutrition')
 @login_required
 def nutrition():
     username = current_user.username
-    return render_template("nutrition.html", username=username, form_data={})
+    return render_cached_page("nutrition.html", username=username, form_data={})
 
 @app.route("/workout_yoga")
 @login_required
@@ -1496,19 +2258,21 @@ def account():
 @app.route('/report')
 @login_required
 def report():
-    return render_template("/footer/report.html")
+    return render_cached_page("/footer/report.html")
 
 @app.route('/review')
 @login_required
 def review():
-    all_comments = Review.query.filter((Review.status == 'public') | ((Review.status == 'private') & 
-        (Review.user_id == current_user.id)), (Review.extra != '') | ((Review.user_id == current_user.id) & (Review.extra == ''))).all()
-    return render_template("/footer/review.html", comment=all_comments)
+    # the user's own reviews (public or private) with the edit and delete buttons
+    own_comments = Review.query.filter_by(user_id=current_user.id).order_by(Review.created_at.desc(), Review.id.desc()).all()
+    # everyone's public reviews, from the cache when possible
+    public_comments = rendered_public_reviews(request.args.get('after'))
+    return render_template("/footer/review.html", comment=own_comments, public_comments=public_comments)
 
 @app.route('/aboutus')
 @login_required
 def aboutus():
-    return render_template("/footer/aboutus.html")
+    return render_cached_page("/footer/aboutus.html")
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,93 @@
+# Runs the main user journey (register, log in, submit every workout, open the rank pages, post a review and a
+# report, change account details) against every database backend we can reach, each in a fresh python process
+# because the app reads DATABASE_URL when it is imported. sqlite always runs, in a throwaway file and in memory.
+# Postgres runs when POSTGRES_TEST_URL points at a database that can be wiped, e.g.
+#
+#     POSTGRES_TEST_URL=postgresql://postgres@localhost/fitness_test python benchmarks/backend_matrix.py
+#
+# run it from the project folder with: python benchmarks/backend_matrix.py
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import helpers
+
+CHILD = '''
+import sys
+sys.path.insert(0, {root!r})
+
+import app
+
+# a clean database every run
+with app.app.app_context():
+    app.db.drop_all()
+    app.db.create_all()
+    app.upgrade_database()
+
+client = app.app.test_client()
+
+def check(response, expected):
+    assert response.status_code == expected or response.location == expected, (response.status_code, response.location)
+
+check(client.post('/register', data=dict(username='matrix_runner', password='pass', confirm_password='pass',
+                                         fname='Matrix', lname='Runner', email='matrix.runner@example.com')), '/')
+check(client.post('/', data=dict(username='matrix_runner', password='pass')), '/Home')
+
+today = app.eastern_today().isoformat()
+check(client.post('/gain_muscles', data={{**{{f'gain_workout_{{n}}': '1' for n in range(1, 9)}}, 'plan_day': today}}), '/thankyou?total=all')
+check(client.post('/gain_muscles', data={{'gain_workout_1': '1', 'plan_day': today}}), '/sorry')
+check(client.post('/lose_weight', data={{'lose_workout_1': '1', 'plan_day': today}}), '/thankyou?total=1')
+check(client.post('/workout_yoga', data={{'first_yoga_vid': '1', 'second_yoga_vid': '1'}}), '/thanks_workout_2?workout_type=Yoga')
+check(client.post('/workout_cardio', data={{}}), '/thanks_none?workout_type=Cardio')
+check(client.post('/workout_hiit', data={{'third_hiit_vid': '1'}}), '/thanks_workout_1?workout_type=Hiit')
+
+check(client.post('/review', data={{'rating': '5', 'extra': 'great app', 'status': 'public'}}), '/thanks_review')
+check(client.post('/report', data={{'problem': 'security', 'extra': 'found something'}}), '/thanks_report')
+check(client.post('/change_username', data={{'new_username': 'matrix_two', 'password': 'pass'}}), '/acount_detail')
+check(client.post('/change_email', data={{'new_email': 'matrix.two@example.com', 'password': 'pass'}}), '/acount_detail')
+check(client.post('/change_name', data={{'new_fname': 'Matrixa', 'new_lname': 'Runnera', 'password': 'pass'}}), '/acount_detail')
+
+for page in ['/Home', '/gain_muscles', '/lose_weight', '/workout_yoga', '/workout_cardio', '/workout_hiit', '/summary',
+             '/review', '/acount_detail', '/rank', '/rank?me=1', '/lose weight rank', '/yoga rank', '/cardio rank', '/hiit rank']:
+    check(client.get(page), 200)
+
+assert b'matrix_two' in client.get('/rank').data
+assert b'great app' in client.get('/review').data
+result = app.app.test_cli_runner().invoke(args=['backfill-leaderboard'])
+assert result.exception is None, result.output
+print('ok')
+'''
+
+
+def run(name, url):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', CHILD.format(root=ROOT)], cwd=ROOT, capture_output=True, text=True,
+                            env={**os.environ, 'DATABASE_URL': url})
+    elapsed = time.perf_counter() - start
+    if result.returncode == 0 and result.stdout.strip().endswith('ok'):
+        print(f'{name:<16} passed ({elapsed:.1f} s)')
+        return True
+    print(f'{name:<16} FAILED')
+    print(result.stderr[-3000:])
+    return False
+
+
+def main():
+    # every backend's process gets the fake youtube client, sqlite also gets the throwaway database
+    helpers.use_throwaway_state('matrix')
+    backends = [('sqlite', os.environ['DATABASE_URL']), ('sqlite :memory:', 'sqlite://')]
+    if os.environ.get('POSTGRES_TEST_URL'):
+        backends.append(('postgres', os.environ['POSTGRES_TEST_URL']))
+    else:
+        print('postgres         skipped (POSTGRES_TEST_URL is not set)')
+
+    passed = [run(name, url) for name, url in backends]
+    sys.exit(0 if all(passed) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+# Compares picking the 8 daily exercises the old way (shuffling each shared list and taking the first one)
+# with generate_exercise_plan, which picks from tuples with its own random generator. The app is imported
+# against a throwaway database with a fake youtube client, so nothing real is touched.
+#
+# run it from the project folder with: python benchmarks/exercise_plan.py
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import helpers
+
+PLANS = 100000
+
+
+def main():
+    helpers.use_throwaway_state('exercise_plan')
+    import app
+
+    # the old way: 8 module level lists that get shuffled in place on every page load
+    old_lists = [list(slot) for slot in app.gain_muscles_exercises]
+
+    def shuffle_plan():
+        plan = []
+        for exercises in old_lists:
+            random.shuffle(exercises)
+            plan.append(exercises[:1][0])
+        return plan
+
+    old = min(timeit.repeat(shuffle_plan, number=PLANS, repeat=5))
+    new = min(timeit.repeat(lambda: app.generate_exercise_plan(app.gain_muscles_exercises), number=PLANS, repeat=5))
+    seeded = min(timeit.repeat(lambda: app.generate_exercise_plan(app.gain_muscles_exercises, seed='1:gain_muscle:2024-01-01'),
+                               number=PLANS, repeat=5))
+
+    # the same seed always gives the same plan
+    assert app.generate_exercise_plan(app.gain_muscles_exercises, seed=7) == app.generate_exercise_plan(app.gain_muscles_exercises, seed=7)
+
+    print(f'{PLANS} plans of {len(app.gain_muscles_exercises)} exercises')
+    print(f'shuffle shared lists:   {old / PLANS * 1e6:.2f} us per plan')
+    print(f'generate_exercise_plan: {new / PLANS * 1e6:.2f} us per plan')
+    print(f'with a seed:            {seeded / PLANS * 1e6:.2f} us per plan')
+
+
+if __name__ == '__main__':
+    main()
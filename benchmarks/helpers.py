@@ -0,0 +1,78 @@
+# Shared by the benchmarks: fake youtube clients and a throwaway copy of everything the app saves, so running a
+# benchmark never touches the real database, the real youtube quota counts or youtube itself.
+# use_throwaway_state() has to be called before app is imported, because the app connects to its database and
+# starts loading the videos as soon as it is imported.
+#
+# the benchmarks import this as benchmarks.helpers (the name the app is given in YOUTUBE_CLIENT_FACTORY), so the
+# app and the benchmark share the same module and see the same fake clients
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import httplib2
+from googleapiclient.discovery import build
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+LATENCY = 0  # seconds each fake youtube search takes
+
+# the api key of every fake client made, so a benchmark can count them
+client_builds = []
+client_builds_lock = threading.Lock()
+
+
+class FakeYouTube:
+    # answers the search().list(...).execute() calls the app makes with one made up video
+    def search(self):
+        return self
+
+    def list(self, **kwargs):
+        return FakeSearch(kwargs['q'])
+
+
+class FakeSearch:
+    def __init__(self, query):
+        self.query = query
+
+    def execute(self):
+        time.sleep(LATENCY)
+        return {'items': [{'id': {'videoId': 'fake'}, 'snippet': {'title': self.query}}]}
+
+
+class FakeYouTubeHttp:
+    # answers every request like the youtube search api would
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        time.sleep(LATENCY)
+        items = [{'id': {'videoId': 'fake'}, 'snippet': {'title': uri}}]
+        return httplib2.Response({'status': '200'}), json.dumps({'items': items}).encode()
+
+
+def fake_youtube_client(api_key):
+    # a fake client that costs nothing to make
+    with client_builds_lock:
+        client_builds.append(api_key)
+    return FakeYouTube()
+
+
+def fake_discovery_client(api_key):
+    # the real youtube client (slow to build, like in the app) with its http swapped for a local fake
+    with client_builds_lock:
+        client_builds.append(api_key)
+    return build('youtube', 'v3', developerKey=api_key, http=FakeYouTubeHttp(), static_discovery=True)
+
+
+def use_throwaway_state(name, client='fake_youtube_client'):
+    # points the app at a new database, quota file and upgrade lock in a temporary folder and at a fake youtube
+    # client, the settings are environment variables so the processes a benchmark starts get them too. returns the
+    # folder
+    folder = tempfile.mkdtemp(prefix=f'{name}-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(folder, f'{name}.db')
+    os.environ['YOUTUBE_QUOTA_FILE'] = os.path.join(folder, 'youtube_quota.json')
+    os.environ['UPGRADE_LOCK_FILE'] = os.path.join(folder, 'upgrade_database.lock')
+    os.environ['YOUTUBE_CLIENT_FACTORY'] = f'benchmarks.helpers:{client}'
+    return folder
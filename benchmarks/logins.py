@@ -0,0 +1,76 @@
+# Measures how many logins per second the app handles while a crowd of threads logs in at once, and how long
+# a page that reads the database (/yoga rank) takes to load during that login storm compared to when nobody is
+# logging in. the page shares the database connections with the logins, so it shows whether they starve it.
+# It uses a throwaway database and a fake youtube client, so nothing real is touched.
+#
+# run it from the project folder with: python benchmarks/logins.py
+# BCRYPT_LOG_ROUNDS and PASSWORD_WORKERS can be set in the environment to compare settings
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import helpers
+
+USERS = 20
+LOGIN_THREADS = 32
+SECONDS = 10
+PAGE = '/yoga rank'
+
+
+def page_times(client, stop):
+    # loads the page over and over and returns how long each load took in milliseconds
+    times = []
+    while time.monotonic() < stop:
+        start = time.perf_counter()
+        assert client.get(PAGE).status_code == 200
+        times.append((time.perf_counter() - start) * 1000)
+        time.sleep(0.05)
+    return times
+
+
+def main():
+    helpers.use_throwaway_state('logins')
+    import app
+
+    with app.app.app_context():
+        password = app.hash_password('password')
+        app.db.session.add_all(app.User(username=f'user{n}', password=password, first_name='a',
+                                        last_name='b', user_email=f'user{n}@example.com') for n in range(USERS))
+        app.db.session.commit()
+
+    # the rank pages need a logged in user
+    reader = app.app.test_client()
+    assert reader.post('/', data={'username': 'user0', 'password': 'password'}).status_code == 302
+    idle = page_times(reader, time.monotonic() + 2)
+
+    logins = []
+    busy = []
+    stop = time.monotonic() + SECONDS
+
+    def log_in(number):
+        while time.monotonic() < stop:
+            response = app.app.test_client().post('/', data={'username': f'user{number % USERS}', 'password': 'password'})
+            logins.append(response.status_code)
+
+    threads = [threading.Thread(target=log_in, args=(number,)) for number in range(LOGIN_THREADS)]
+    for thread in threads:
+        thread.start()
+    busy = page_times(reader, stop)
+    for thread in threads:
+        thread.join()
+
+    logged_in = logins.count(302)
+    print(f"{app.app.config['PASSWORD_HASH_METHOD']} with {app.app.config['BCRYPT_LOG_ROUNDS']} rounds, "
+          f"{app.app.config['PASSWORD_WORKERS']} password workers, {LOGIN_THREADS} threads logging in for {SECONDS} s")
+    print(f'logins: {logged_in} ({logged_in / SECONDS:.1f}/s), turned away (503): {logins.count(503)}')
+    print(f'{PAGE} while idle:        median {statistics.median(idle):.1f} ms')
+    print(f'{PAGE} during the logins: median {statistics.median(busy):.1f} ms, max {max(busy):.1f} ms, '
+          f'{len(busy)} loads')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+# Measures requests per second on the pages that are the same for everyone or only show the username,
+# first with every visit rendering the template (like before), then from the page cache, and then with the
+# browser sending back the ETag it got so the answer is a 304 with no page in it.
+# It uses a throwaway database and a fake youtube client, so nothing real is touched.
+#
+# run it from the project folder with: python benchmarks/page_cache.py
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import helpers
+
+REQUESTS = 2000
+PAGES = ['/aboutus', '/report', '/nutrition', '/Home', '/forgot']
+
+
+def requests_per_second(client, page, status=200, headers=None, forget=None):
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        if forget is not None:
+            # empties the page cache so the template is rendered again, like on every visit before
+            forget()
+        assert client.get(page, headers=headers).status_code == status
+    return REQUESTS / (time.perf_counter() - start)
+
+
+def main():
+    helpers.use_throwaway_state('page_cache')
+    import app
+
+    client = app.app.test_client()
+    client.post('/register', data={'username': 'bench', 'password': 'password', 'confirm_password': 'password',
+                                   'fname': 'Bench', 'lname': 'Mark', 'email': 'bench@example.com'})
+    assert client.post('/', data={'username': 'bench', 'password': 'password'}).status_code == 302
+
+    print(f'{REQUESTS} requests to each page, in requests/s')
+    print(f'{"page":16} {"rendered":>9} {"cached":>9} {"304":>9}')
+    for page in PAGES:
+        etag = client.get(page).headers['ETag']
+        rendered = requests_per_second(client, page, forget=app.page_cache.clear)
+        cached = requests_per_second(client, page)
+        not_modified = requests_per_second(client, page, 304, {'If-None-Match': etag})
+        print(f'{page:16} {rendered:9.0f} {cached:9.0f} {not_modified:9.0f}')
+
+
+if __name__ == '__main__':
+    main()
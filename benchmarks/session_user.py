@@ -0,0 +1,45 @@
+# Measures requests per second on /Home for a logged in user, first with the session user cache turned off
+# (the user is read from the database on every request, like before) and then with it on.
+# It uses a throwaway database and a fake youtube client, so nothing real is touched.
+#
+# run it from the project folder with: python benchmarks/session_user.py
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import helpers
+
+REQUESTS = 3000
+
+
+def requests_per_second(client):
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        assert client.get('/Home').status_code == 200
+    return REQUESTS / (time.perf_counter() - start)
+
+
+def main():
+    helpers.use_throwaway_state('session_user')
+    import app
+
+    client = app.app.test_client()
+    client.post('/register', data={'username': 'bench', 'password': 'password', 'confirm_password': 'password',
+                                   'fname': 'Bench', 'lname': 'Mark', 'email': 'bench@example.com'})
+    assert client.post('/', data={'username': 'bench', 'password': 'password'}).status_code == 302
+    requests_per_second(client)  # warms up the templates
+
+    app.app.config['SESSION_USER_CACHE_SECONDS'] = 0
+    uncached = requests_per_second(client)
+    app.app.config['SESSION_USER_CACHE_SECONDS'] = 30
+    cached = requests_per_second(client)
+
+    print(f'{REQUESTS} requests to /Home')
+    print(f'user read from the database every time: {uncached:.0f} requests/s')
+    print(f'user from the session user cache:       {cached:.0f} requests/s ({cached / uncached:.2f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+# Hammers a throwaway copy of the app's tables the way a few gunicorn workers would: every worker process runs
+# writer threads saving workouts (the same insert plus leaderboard update the submit handlers do) and reader
+# threads paging through the leaderboards. At the end it counts how many "database is locked" errors came back.
+# Run it with --no-pragmas to compare with sqlite's default settings.
+#
+# run it from the project folder with: python benchmarks/sqlite_stress.py [--no-pragmas]
+import itertools
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine, func, insert, select, update
+from sqlalchemy.exc import OperationalError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import helpers
+
+WORKERS = 4
+WRITERS = 4  # per worker
+READERS = 4  # per worker
+SECONDS = 10
+USERS = 200
+
+
+def load_app():
+    import app
+
+    if '--no-pragmas' in sys.argv:
+        app.app.config['SQLITE_PRAGMAS'] = {}
+    return app
+
+
+def worker(path, number):
+    # one worker process, the app's connect event sets the pragmas on its engine
+    app = load_app()
+    engine = create_engine(f'sqlite:///{path}', pool_size=WRITERS + READERS)
+    categories = list(app.workout_categories)
+    workout, total = app.workout.__table__, app.leaderboard_total.__table__
+    counts = {'writes': 0, 'reads': 0, 'locked': 0}
+    counts_lock = threading.Lock()
+    stop = time.monotonic() + SECONDS
+    # a user can only save one workout per category per day, so every write here gets a day of its own
+    days = itertools.count(number * 100000)
+    days_lock = threading.Lock()
+
+    def count(name):
+        with counts_lock:
+            counts[name] += 1
+
+    def write():
+        rng = random.Random()
+        while time.monotonic() < stop:
+            category, user_id, amount = rng.choice(categories), rng.randint(1, USERS), rng.randint(1, 8)
+            with days_lock:
+                day = date(2000, 1, 1) + timedelta(days=next(days))
+            try:
+                with engine.begin() as connection:
+                    connection.execute(insert(workout).values(user_id=user_id, category=category, amount=amount,
+                                                              created_at=app.utc_now(), local_date=day))
+                    updated = connection.execute(update(total).where(total.c.category == category, total.c.user_id == user_id)
+                                                 .values(total=total.c.total + amount)).rowcount
+                    if updated == 0:
+                        connection.execute(insert(total).values(category=category, user_id=user_id, total=amount))
+                count('writes')
+            except OperationalError as error:
+                if 'locked' not in str(error):
+                    raise
+                count('locked')
+
+    def read():
+        rng = random.Random()
+        while time.monotonic() < stop:
+            category = rng.choice(categories)
+            try:
+                with engine.connect() as connection:
+                    connection.execute(select(total.c.user_id, total.c.total).where(total.c.category == category)
+                                       .order_by(total.c.total.desc(), total.c.user_id).limit(50)).all()
+                    connection.execute(select(func.count()).select_from(total)
+                                       .where(total.c.category == category, total.c.total > rng.randint(0, 50))).scalar()
+                count('reads')
+            except OperationalError as error:
+                if 'locked' not in str(error):
+                    raise
+                count('locked')
+
+    threads = [threading.Thread(target=write) for _ in range(WRITERS)] + [threading.Thread(target=read) for _ in range(READERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counts
+
+
+def main():
+    # the app itself opens a throwaway database too, so the real one is never touched
+    folder = helpers.use_throwaway_state('sqlite_stress')
+    app = load_app()
+    path = os.path.join(folder, 'stress.db')
+    engine = create_engine(f'sqlite:///{path}')
+    app.db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(app.User), [
+            {'id': n, 'username': f'user{n}', 'password': 'x', 'first_name': 'a', 'last_name': 'b',
+             'user_email': f'user{n}@example.com', 'created_at': app.utc_now(), 'last_login': app.utc_now()}
+            for n in range(1, USERS + 1)])
+        journal_mode = connection.exec_driver_sql('PRAGMA journal_mode').scalar()
+    engine.dispose()
+
+    # fresh processes like gunicorn workers, none of them share a connection
+    with multiprocessing.get_context('spawn').Pool(WORKERS) as pool:
+        results = pool.starmap(worker, [(path, number) for number in range(WORKERS)])
+    counts = {name: sum(result[name] for result in results) for name in results[0]}
+
+    # every saved workout has to be in the running totals
+    workout, total = app.workout.__table__, app.leaderboard_total.__table__
+    with engine.connect() as connection:
+        assert connection.execute(select(func.sum(workout.c.amount))).scalar() == connection.execute(select(func.sum(total.c.total))).scalar()
+
+    print(f'journal_mode={journal_mode}, {WORKERS} workers with {WRITERS} writer and {READERS} reader threads each, {SECONDS} s')
+    print(f'writes: {counts["writes"]} ({counts["writes"] / SECONDS:.0f}/s), reads: {counts["reads"]} ({counts["reads"] / SECONDS:.0f}/s)')
+    print(f'"database is locked" errors: {counts["locked"]}')
+    print('OK' if counts['locked'] == 0 else 'LOCK ERRORS')
+
+
+if __name__ == '__main__':
+    main()
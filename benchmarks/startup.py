@@ -0,0 +1,59 @@
+# Measures how long it takes from importing app.py to answering the first request, with a fake youtube client
+# so the network isn't part of the time. It runs against a throwaway copy of instance/database.db (and a
+# throwaway youtube quota file), the first run upgrades the copy and isn't counted.
+#
+# run it from the project folder with: python benchmarks/startup.py
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import helpers
+
+RUNS = 10
+BUDGET_MS = 200
+
+# runs in a fresh python process every time so nothing is already imported
+CHILD = '''
+import sys, time
+sys.path.insert(0, {root!r})
+
+# the libraries are imported first so only the app's own startup is timed
+import flask, flask_sqlalchemy, flask_login, flask_bcrypt, apscheduler.schedulers.background, pytz
+import googleapiclient.discovery, benchmarks.helpers
+
+start = time.perf_counter()
+import app
+response = app.app.test_client().get('/forgot')
+elapsed = time.perf_counter() - start
+assert response.status_code == 200
+print(elapsed * 1000)
+'''
+
+
+def start_app():
+    # the environment from use_throwaway_state is passed on to the child
+    output = subprocess.run([sys.executable, '-c', CHILD.format(root=ROOT)], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def main():
+    folder = helpers.use_throwaway_state('startup')
+    shutil.copy(os.path.join(ROOT, 'instance', 'database.db'), os.path.join(folder, 'startup.db'))
+    first = start_app()
+    timings = [start_app() for _ in range(RUNS)]
+
+    median = statistics.median(timings)
+    print(f'import to first request over {RUNS} runs: median {median:.1f} ms, '
+          f'min {min(timings):.1f} ms, max {max(timings):.1f} ms')
+    print(f'first run, upgrading the copied database: {first:.1f} ms')
+    print('OK' if median < BUDGET_MS else f'SLOWER than the {BUDGET_MS} ms budget')
+
+
+if __name__ == '__main__':
+    main()
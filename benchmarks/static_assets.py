@@ -0,0 +1,90 @@
+# Adds up the bytes a first visit to each page downloads for its stylesheet and pictures, before the static
+# build (the original files, css not compressed) and after it (the css as brotli, the pictures a browser that
+# understands AVIF picks from the image-set). It runs build_static.py first and uses a throwaway database and
+# a fake youtube client, so nothing real is touched.
+#
+# run it from the project folder with: python benchmarks/static_assets.py
+import os
+import re
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import helpers
+
+PAGES = ['/', '/register', '/Home', '/nutrition', '/workout_yoga', '/workout_cardio', '/workout_hiit',
+         '/gain_muscles', '/lose_weight', '/summary', '/acount_detail', '/aboutus']
+
+
+def background_pictures(css):
+    # the first picture each css rule with a background asks for, by its selector
+    pictures = {}
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.DOTALL)
+    for selector, body in re.findall(r'([^{}]+)\{([^}]*)\}', css):
+        # a browser that understands image-set() uses it over the plain url() before it, and takes its first choice
+        found = re.findall(r'url\(\s*"?([^")]+)"?\s*\)', body.split('image-set(')[-1])
+        if found:
+            pictures[selector.strip()] = found[0]
+    return pictures
+
+
+def page_pictures(html, pictures):
+    # the background pictures of the rules whose id or class is on the page
+    return [picture for selector, picture in pictures.items()
+            if (selector.startswith('#') and f'id="{selector[1:]}"' in html)
+            or (selector.startswith('.') and re.search(rf'class="[^"]*\b{re.escape(selector[1:])}\b', html))]
+
+
+def main():
+    import build_static
+    build_static.build()
+
+    helpers.use_throwaway_state('static_assets')
+    import app
+
+    client = app.app.test_client()
+    client.post('/register', data={'username': 'bench', 'password': 'password', 'confirm_password': 'password',
+                                   'fname': 'Bench', 'lname': 'Mark', 'email': 'bench@example.com'})
+
+    static = app.app.static_folder
+    with open(os.path.join(static, 'style.css')) as file:
+        old_pictures = background_pictures(file.read())
+    built_css = app.static_manifest['files']['style.css']
+    with open(os.path.join(static, built_css)) as file:
+        new_pictures = background_pictures(file.read())
+
+    def size(path):
+        return os.path.getsize(os.path.join(static, path))
+
+    print(f'{"page":16} {"before":>10} {"after":>10} {"saved":>7}')
+    total_before = total_after = 0
+    for page in PAGES:
+        if page == '/Home':
+            assert client.post('/', data={'username': 'bench', 'password': 'password'}).status_code == 302
+        html = client.get(page).get_data(as_text=True)
+        assert built_css in html
+
+        # the stylesheet: the plain file before, the brotli copy the app sends now
+        response = client.get(f'/static/{built_css}', headers={'Accept-Encoding': 'br, gzip'})
+        assert response.headers['Content-Encoding'] == 'br'
+        assert 'immutable' in response.headers['Cache-Control']
+        before = size('style.css')
+        after = len(response.data)
+
+        for picture in page_pictures(html, old_pictures):
+            before += size(picture)
+        for picture in page_pictures(html, new_pictures):
+            after += size(os.path.join('build', picture))
+        for image in re.findall(r'<img src="/static/([^"]+)"', html):
+            before += size(next(name for name, built in app.static_manifest['files'].items() if built == image))
+            after += size(image)
+
+        total_before += before
+        total_after += after
+        print(f'{page:16} {before:10,} {after:10,} {1 - after / before:7.0%}')
+    print(f'{"all pages":16} {total_before:10,} {total_after:10,} {1 - total_after / total_before:7.0%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+# Compares refreshing the nine workout searches one after another (the old way) with running them
+# all at the same time. The real youtube client is used, but its http transport is a local fake that
+# waits a bit and answers with made up videos, so nothing goes to youtube. The database and the quota
+# file are throwaway ones, so no real quota is counted either.
+#
+# run it from the project folder with: python benchmarks/video_refresh.py
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import helpers
+
+
+def main():
+    # the fake client has to be in place before the import, the first video load starts straight away
+    helpers.LATENCY = 0.2
+    helpers.use_throwaway_state('video_refresh', client='fake_discovery_client')
+    import app
+
+    # waits for that first load so it doesn't run at the same time as the timed refreshes
+    while app.yoga_videos[0] is app.video_placeholder:
+        time.sleep(0.05)
+
+    searches = [search for workout_searches in app.video_searches.values() for search in workout_searches]
+
+    # the old way: every search waits for the one before it
+    start = time.perf_counter()
+    for query, max_results in searches:
+        assert app.search_youtube_videos(query, max_results)
+    one_by_one = time.perf_counter() - start
+
+    # the new way: all the searches at once on the fetch pool
+    for _ in range(2):
+        start = time.perf_counter()
+        results = app.fetch_all_workout_videos(search=app.search_youtube_videos)
+        concurrent = time.perf_counter() - start
+        assert all(all(videos) for videos in results.values())
+
+    print(f'{len(searches)} searches at {helpers.LATENCY * 1000:.0f} ms each')
+    print(f'one after another: {one_by_one * 1000:.0f} ms')
+    print(f'at the same time:  {concurrent * 1000:.0f} ms (second refresh)')
+    print(f'clients built: {len(helpers.client_builds)} (one per key per fetch thread, reused afterwards)')
+
+
+if __name__ == '__main__':
+    main()
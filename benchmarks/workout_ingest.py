@@ -0,0 +1,82 @@
+# Sends a burst of workout forms through the real endpoints from many threads, like everyone submitting at 8pm,
+# first with one commit per form (WORKOUT_BATCH_SIZE = 1, how it worked before) and then with the batched ingest.
+# It counts the forms saved and the commits made per second. It uses a throwaway database, a fake youtube client
+# and cheap bcrypt hashes so logging all the users in doesn't take long.
+#
+# run it from the project folder with: python benchmarks/workout_ingest.py
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import helpers
+
+USERS = 200  # per run, each of them sends all 5 workout forms
+THREADS = 32
+
+
+def main():
+    helpers.use_throwaway_state('ingest')
+    os.environ['BCRYPT_LOG_ROUNDS'] = '4'
+    import app
+    from sqlalchemy import event
+
+    commits = []
+    with app.app.app_context():
+        event.listen(app.db.engine, 'commit', lambda connection: commits.append(1))
+        password = app.hash_password('password')
+        app.db.session.add_all(app.User(username=f'user{n}', password=password, first_name='a', last_name='b',
+                                        user_email=f'user{n}@example.com') for n in range(USERS * 2))
+        app.db.session.commit()
+
+    def run(first_user, batch_size):
+        app.app.config['WORKOUT_BATCH_SIZE'] = batch_size
+        clients = []
+        for number in range(first_user, first_user + USERS):
+            client = app.app.test_client()
+            client.post('/', data={'username': f'user{number}', 'password': 'password'})
+            clients.append(client)
+        app.flush_logins()
+
+        today = app.eastern_today().isoformat()
+        forms = [(client, url, data) for client in clients for url, data in [
+            ('/gain_muscles', {'gain_workout_1': '1', 'plan_day': today}),
+            ('/lose_weight', {'lose_workout_1': '1', 'lose_workout_2': '1', 'plan_day': today}),
+            ('/workout_yoga', {'first_yoga_vid': '1'}),
+            ('/workout_cardio', {'first_cardio_vid': '1', 'second_cardio_vid': '1'}),
+            ('/workout_hiit', {'first_hiit_vid': '1', 'second_hiit_vid': '1', 'third_hiit_vid': '1'}),
+        ]]
+        redirects = []
+        forms_lock = threading.Lock()
+
+        def send():
+            while True:
+                with forms_lock:
+                    if not forms:
+                        return
+                    client, url, data = forms.pop()
+                redirects.append(client.post(url, data=data).location)
+
+        commits.clear()
+        threads = [threading.Thread(target=send) for _ in range(THREADS)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        assert all(location.startswith('/thank') for location in redirects), set(redirects)
+        print(f'batch size {batch_size:>3}: {len(redirects)} forms in {elapsed:.2f} s, {len(redirects) / elapsed:.0f} forms/s, '
+              f'{len(commits)} commits ({len(commits) / elapsed:.0f}/s)')
+
+    batch_size = app.app.config['WORKOUT_BATCH_SIZE']
+    print(f'{USERS} users sending 5 workout forms each from {THREADS} threads')
+    run(0, 1)
+    run(USERS, batch_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+# Builds the files the app serves from static/build: every file in static/ gets a copy with a hash of its
+# content in the name, so browsers can keep it for a year and still get the new one when it changes. The
+# pictures also get smaller WebP and AVIF copies (made no wider than MAX_IMAGE_WIDTH), style.css is pointed
+# at them, and the css gets gzip and brotli copies made ahead of time. static/build/manifest.json lists the
+# new names, and app.py reads it when it starts so url_for('static', ...) gives the fingerprinted file.
+#
+# Pillow (with AVIF support) and brotli are only needed here, when one of them is missing those copies are
+# skipped and the rest still works.
+#
+# run it from the project folder before starting the app with: python build_static.py
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+
+try:
+    from PIL import Image, features
+except ImportError:
+    Image = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATIC = os.path.join(ROOT, 'static')
+BUILD = os.path.join(STATIC, 'build')
+
+IMAGE_TYPES = {'.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.webp': 'image/webp'}
+MAX_IMAGE_WIDTH = 1600
+WEBP_QUALITY = 80
+AVIF_QUALITY = 60
+
+# a css declaration that puts one picture in the background, like "background-image: url(yogapic.png);"
+BACKGROUND_URL = re.compile(r'(background(?:-image)?)\s*:\s*url\(\s*[\'"]?([^\'")]+)[\'"]?\s*\)([^;]*);')
+
+
+def write_fingerprinted(name, data):
+    # saves data as build/<name>.<hash><ext> and returns the path from the static folder
+    stem, ext = os.path.splitext(name)
+    built = f'{stem}.{hashlib.sha256(data).hexdigest()[:10]}{ext}'
+    with open(os.path.join(BUILD, built), 'wb') as file:
+        file.write(data)
+    return f'build/{built}'
+
+
+def smaller_images(name, original):
+    # returns the WebP and AVIF copies of a picture that came out smaller than it, smallest first
+    if Image is None:
+        return []
+    with Image.open(os.path.join(STATIC, name)) as image:
+        image.load()
+    # the formats below can't save CMYK jpegs, and keep transparency only when the picture has some
+    if image.mode == 'CMYK':
+        # the CMYK colour profile doesn't fit the converted picture and would be copied into the AVIF
+        image.info.pop('icc_profile', None)
+    image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+    if image.width > MAX_IMAGE_WIDTH:
+        image = image.resize((MAX_IMAGE_WIDTH, round(image.height * MAX_IMAGE_WIDTH / image.width)), Image.LANCZOS)
+
+    formats = [('WEBP', '.webp', 'image/webp', WEBP_QUALITY)]
+    if features.check('avif'):
+        formats.insert(0, ('AVIF', '.avif', 'image/avif', AVIF_QUALITY))
+
+    variants = []
+    for image_format, ext, mime_type, quality in formats:
+        path = os.path.join(BUILD, 'variant' + ext)
+        image.save(path, image_format, quality=quality)
+        with open(path, 'rb') as file:
+            data = file.read()
+        os.remove(path)
+        if len(data) < len(original):
+            variants.append((len(data), write_fingerprinted(os.path.splitext(name)[0] + ext, data), mime_type))
+    return [(path, mime_type) for _, path, mime_type in sorted(variants)]
+
+
+def rewrite_css(css, files, variants):
+    # points the css at the fingerprinted pictures. browsers that understand image-set() pick the first type
+    # they can show, and older ones keep the plain url() given just before it
+    def background(match):
+        prop, name, rest = match.groups()
+        if name not in files:
+            return match.group(0)
+        fallback = f'{prop}: url({os.path.basename(files[name])}){rest};'
+        if not variants.get(name):
+            return fallback
+        choices = variants[name] + [(files[name], IMAGE_TYPES[os.path.splitext(name)[1].lower()])]
+        image_set = ', '.join(f'url("{os.path.basename(path)}") type("{mime_type}")' for path, mime_type in choices)
+        return f'{fallback} {prop}: image-set({image_set}){rest};'
+
+    return BACKGROUND_URL.sub(background, css)
+
+
+def precompress(path, data):
+    # saves gzip and brotli copies next to the file for the encodings that make it smaller
+    encodings = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encodings['br'] = brotli.compress(data, quality=11)
+
+    saved = []
+    for encoding, compressed in encodings.items():
+        if len(compressed) < len(data):
+            with open(os.path.join(STATIC, path) + ('.br' if encoding == 'br' else '.gz'), 'wb') as file:
+                file.write(compressed)
+            saved.append(encoding)
+    return saved
+
+
+def build():
+    # starts from an empty folder so files from older builds don't pile up
+    shutil.rmtree(BUILD, ignore_errors=True)
+    os.makedirs(BUILD)
+
+    files = {}
+    variants = {}
+    stylesheets = []
+    for name in sorted(os.listdir(STATIC)):
+        if not os.path.isfile(os.path.join(STATIC, name)):
+            continue
+        if name.endswith('.css'):
+            stylesheets.append(name)
+            continue
+        with open(os.path.join(STATIC, name), 'rb') as file:
+            data = file.read()
+        files[name] = write_fingerprinted(name, data)
+        if os.path.splitext(name)[1].lower() in IMAGE_TYPES:
+            variants[name] = smaller_images(name, data)
+
+    precompressed = {}
+    for name in stylesheets:
+        with open(os.path.join(STATIC, name), encoding='utf-8') as file:
+            css = rewrite_css(file.read(), files, variants).encode()
+        files[name] = write_fingerprinted(name, css)
+        precompressed[files[name]] = precompress(files[name], css)
+
+    manifest = {'files': files, 'precompressed': precompressed}
+    with open(os.path.join(BUILD, 'manifest.json'), 'w') as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
+
+
+def main():
+    manifest = build()
+    for name, built in manifest['files'].items():
+        size = os.path.getsize(os.path.join(STATIC, built))
+        extra = ', '.join(manifest['precompressed'].get(built, []))
+        print(f'{name:52} -> {built} ({size} bytes{", " + extra if extra else ""})')
+    if Image is None:
+        print('Pillow is not installed, so no WebP or AVIF copies were made')
+    if brotli is None:
+        print('brotli is not installed, so the css only has a gzip copy')
+
+
+if __name__ == '__main__':
+    main()